@@ -0,0 +1,221 @@
+from buscas import *
+
+
+def arvore_ate(destino: Cidade, grafo=None):
+    """
+    Dijkstra completo a partir do destino, seguindo as estradas ao contrário (por causa
+    das de mão única). Isso dá o custo de cada cidade até o destino, e por onde seguir
+    para chegar lá.
+
+    :return: (distancias, proximos), dicionários cidade -> custo até o destino e
+             cidade -> próxima cidade no melhor caminho (None no destino)
+    """
+    distancias = {destino: 0}
+    proximos = {destino: None}
+    acomodados = set()
+    ordem = count()
+    fila_prioridade = FilaPrioridade([[0, next(ordem), destino]])
+
+    while fila_prioridade:
+        custo_atual, _, cidade = fila_prioridade.pop()
+        if cidade in acomodados:
+            continue
+        acomodados.add(cidade)
+        for custo, vizinho in vizinhos_com_custo(cidade, grafo, reverso=True):
+            novo_custo = custo_atual + custo
+            if novo_custo < distancias.get(vizinho, inf):
+                distancias[vizinho] = novo_custo
+                proximos[vizinho] = cidade
+                fila_prioridade.add([novo_custo, next(ordem), vizinho])
+
+    return distancias, proximos
+
+
+def desvio(partida: Cidade, destino: Cidade, distancias: dict, proximos: dict, bloqueadas: set,
+           proibidos: set, grafo=None, rastreador: Rastreador = SILENCIOSO):
+    """
+    Melhor caminho da partida até o destino sem passar pelas cidades bloqueadas e sem
+    sair da partida direto para as cidades proibidas.
+
+    Tirar cidades e estradas só aumenta os custos, então a distância até o destino no
+    mapa inteiro (distancias) é uma heurística consistente, e exata enquanto o caminho
+    não esbarra no que foi tirado. Se o caminho da árvore já desvia de tudo, ele é a
+    resposta e nem precisamos buscar; se não, o A* com essa heurística vai quase reto.
+
+    :return: (caminho, custos acumulados a partir da partida), ou None se não houver caminho
+    """
+    caminho = [partida]
+    proximo = proximos.get(partida)
+    if proximo is not None and proximo not in proibidos:
+        while proximo is not None and proximo not in bloqueadas:
+            caminho.append(proximo)
+            proximo = proximos[proximo]
+        if proximo is None:
+            custos = [distancias[partida] - distancias[cidade] for cidade in caminho]
+            return caminho, custos
+
+    custos = {partida: 0}
+    anteriores = {partida: None}
+    fechados = set()
+    ordem = count()
+    fronteira = FilaPrioridade([[distancias[partida], next(ordem), 0, partida]])
+
+    while fronteira:
+        _, _, custo_atual, cidade = fronteira.pop()
+        rastreador.desempilha(cidade)
+        if cidade in fechados:
+            continue
+        fechados.add(cidade)
+        rastreador.visita(cidade)
+
+        if cidade == destino:
+            caminho = [destino]
+            while anteriores[caminho[-1]] is not None:
+                caminho.append(anteriores[caminho[-1]])
+            caminho.reverse()
+            return caminho, [custos[c] for c in caminho]
+
+        for custo, vizinho in vizinhos_com_custo(cidade, grafo):
+            # Cidades fora de distancias não chegam no destino (só com estradas de mão única)
+            if vizinho in bloqueadas or vizinho not in distancias or (cidade is partida and vizinho in proibidos):
+                continue
+            novo_custo = custo_atual + custo
+            if novo_custo < custos.get(vizinho, inf):
+                custos[vizinho] = novo_custo
+                anteriores[vizinho] = cidade
+                rastreador.relaxa(cidade, vizinho, novo_custo)
+                fronteira.add([novo_custo + distancias[vizinho], next(ordem), novo_custo, vizinho])
+                rastreador.empilha(vizinho, len(fronteira))
+
+    return None
+
+
+def prefixo_comum(a: list, b: list):
+    """Quantidade de cidades iguais no começo dos dois caminhos"""
+    n = 0
+    for x, y in zip(a, b):
+        if x is not y:
+            break
+        n += 1
+    return n
+
+
+def k_shortest_paths(origem: Cidade, destino: Cidade, k: int, grafo=None, rastreador: Rastreador = SILENCIOSO):
+    """
+    Os k melhores caminhos sem ciclos entre origem e destino, do mais barato para o
+    mais caro (algoritmo de Yen).
+
+    Cada novo caminho sai de um caminho já aceito: mantemos o começo dele (a raiz) até
+    uma cidade de desvio, e a partir dela buscamos o melhor caminho que não repete a
+    raiz nem segue por onde os caminhos aceitos com a mesma raiz já seguiram. Os
+    candidatos ficam numa heap, e o mais barato vira o próximo caminho aceito.
+
+    Para não custar k buscas completas:
+    - um único Dijkstra a partir do destino dá a heurística de todos os desvios (ver desvio);
+    - um caminho só gera desvios a partir do ponto onde ele mesmo desviou, porque os
+      desvios anteriores já foram gerados pelo caminho de onde ele saiu (Lawler).
+
+    :return: lista de até k Trilhas (menos, se não houver tantos caminhos)
+    """
+    if k <= 0 or not reachable(origem, destino, grafo):
+        return []
+
+    rastreador.inicio()
+    distancias, proximos = arvore_ate(destino, grafo)
+    if origem not in distancias:
+        rastreador.fim()
+        return []
+
+    primeiro = desvio(origem, destino, distancias, proximos, set(), set(), grafo, rastreador)
+    # Caminhos aceitos, no formato (cidades, custos acumulados, índice do desvio)
+    aceitos = [(primeiro[0], primeiro[1], 0)]
+    conhecidos = {tuple(primeiro[0])}
+    ordem = count()
+    candidatos = FilaPrioridade([])
+
+    while len(aceitos) < k:
+        caminho, custos, inicio = aceitos[-1]
+        comuns = [prefixo_comum(caminho, outro) for outro, _, _ in aceitos]
+
+        for i in range(inicio, len(caminho) - 1):
+            partida = caminho[i]
+            # Para onde os caminhos aceitos com a mesma raiz já seguiram a partir daqui
+            proibidos = {outro[i + 1] for (outro, _, _), comum in zip(aceitos, comuns) if comum > i}
+            bloqueadas = set(caminho[:i])
+
+            encontrado = desvio(partida, destino, distancias, proximos, bloqueadas, proibidos, grafo, rastreador)
+            if encontrado is None:
+                continue
+            novo = caminho[:i] + encontrado[0]
+            chave = tuple(novo)
+            if chave in conhecidos:
+                continue
+            conhecidos.add(chave)
+            novos_custos = custos[:i] + [custos[i] + custo for custo in encontrado[1]]
+            candidatos.add([novos_custos[-1], next(ordem), novo, novos_custos, i])
+
+        melhor = candidatos.pop()
+        if melhor is None:
+            break
+        aceitos.append((melhor[2], melhor[3], melhor[4]))
+
+    rastreador.fim()
+    return [trilha_do_caminho(caminho, custos) for caminho, custos, _ in aceitos]
+
+
+if __name__ == "__main__":
+    from geradores import grade, geometrico
+    import random
+    import time
+
+    def yen_ingenuo(origem, destino, k, cidades):
+        """Yen sem nenhum reaproveitamento: um Dijkstra novo para cada desvio de cada caminho"""
+        zeros = dict.fromkeys(cidades, 0)
+
+        def dijkstra_sem(partida, bloqueadas, proibidos):
+            return desvio(partida, destino, zeros, {}, bloqueadas, proibidos)
+
+        primeiro = dijkstra_sem(origem, set(), set())
+        if primeiro is None:
+            return []
+        aceitos = [primeiro]
+        candidatos = list()
+        while len(aceitos) < k:
+            caminho, custos = aceitos[-1]
+            for i in range(len(caminho) - 1):
+                raiz = caminho[:i + 1]
+                proibidos = {outro[i + 1] for outro, _ in aceitos if outro[:i + 1] == raiz}
+                encontrado = dijkstra_sem(caminho[i], set(caminho[:i]), proibidos)
+                if encontrado is None:
+                    continue
+                novo = (caminho[:i] + encontrado[0], custos[:i] + [custos[i] + c for c in encontrado[1]])
+                if novo not in candidatos and all(novo[0] != a for a, _ in aceitos):
+                    candidatos.append(novo)
+            if not candidatos:
+                break
+            candidatos.sort(key=lambda c: c[1][-1])
+            aceitos.append(candidatos.pop(0))
+        return aceitos
+
+    natal, mossoro, caico, assu = (Cidade(n) for n in ('natal', 'mossoro', 'caico', 'assu'))
+    Estrada(natal, assu, 200)
+    Estrada(assu, mossoro, 80)
+    Estrada(natal, caico, 280)
+    Estrada(caico, mossoro, 150)
+    Estrada(caico, assu, 100)
+    for trilha in k_shortest_paths(natal, mossoro, 5):
+        print("%6.0fkm  %s" % (trilha.custo, trilha))
+
+    print()
+    print("%-12s %8s %4s %14s %14s %14s" % ("mapa", "cidades", "k", "uma busca", "yen", "yen ingênuo"))
+    for nome, cidades in (("grade", grade(40, 40)), ("geometrico", geometrico(3000))):
+        sorteio = random.Random(0)
+        pares = [sorteio.sample(cidades, 2) for _ in range(5)]
+        for k in (2, 5, 10):
+            tempos = list()
+            for busca in (lambda a, b: astar(a, b), lambda a, b: k_shortest_paths(a, b, k),
+                          lambda a, b: yen_ingenuo(a, b, k, cidades)):
+                inicio = time.perf_counter()
+                resultados = [busca(a, b) for a, b in pares]
+                tempos.append((time.perf_counter() - inicio) * 1000 / len(pares))
+            print("%-12s %8d %4d %12.2fms %12.2fms %12.2fms" % (nome, len(cidades), k, *tempos))
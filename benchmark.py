@@ -0,0 +1,173 @@
+from buscas import *
+from geradores import grade, geometrico, livre_de_escala
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+"""
+Geradores de mapa, por nome. Cada um recebe a quantidade aproximada de cidades e a semente.
+"""
+GERADORES = {
+    'grade': lambda n, semente: grade(round(math.sqrt(n)), round(math.sqrt(n)), semente),
+    'geometrico': lambda n, semente: geometrico(n, semente=semente),
+    'livre_de_escala': lambda n, semente: livre_de_escala(n, semente=semente),
+}
+
+"""
+Algoritmos medidos, por nome. Cada um recebe origem, destino, a lista de cidades e o rastreador.
+"""
+ALGORITMOS = {
+    'breadth_first': lambda a, b, cidades, r: breadth_first(a, b, rastreador=r),
+    'greedy_best_first': lambda a, b, cidades, r: greedy_best_first(a, b, rastreador=r),
+    'iterative_deepening': lambda a, b, cidades, r: iterative_deepening(a, b, rastreador=r),
+    'astar': lambda a, b, cidades, r: astar(a, b, rastreador=r),
+    'dijkstra': lambda a, b, cidades, r: dijkstra(a, cidades, b, rastreador=r)[b],
+    'bidirectional_dijkstra': lambda a, b, cidades, r: bidirectional_dijkstra(a, b, rastreador=r),
+    'bidirectional_astar': lambda a, b, cidades, r: bidirectional_astar(a, b, rastreador=r),
+}
+
+"""
+Maior mapa em que cada algoritmo é medido. A busca em profundidade iterativa refaz a
+busca do zero a cada limite, e passa de minutos muito antes dos outros.
+"""
+TAMANHO_MAXIMO = {
+    'iterative_deepening': 1000,
+}
+
+
+def medir(nome: str, cidades: list, pares: list):
+    """
+    Roda o algoritmo em todos os pares duas vezes: uma para medir tempo e contadores,
+    e outra, só com o primeiro par, com tracemalloc ligado para medir o pico de memória
+    (o tracemalloc deixa tudo bem mais lento, então não entra na medição de tempo).
+
+    :return: dicionário com os resultados
+    """
+    algoritmo = ALGORITMOS[nome]
+    contador = Contador()
+    encontrados = 0
+
+    inicio = time.perf_counter()
+    for origem, destino in pares:
+        trilha = algoritmo(origem, destino, cidades, contador)
+        # dijkstra devolve uma trilha de custo infinito quando não há caminho
+        if trilha is not None and trilha.custo < inf:
+            encontrados += 1
+    tempo = time.perf_counter() - inicio
+
+    pico = 0
+    if pares:
+        tracemalloc.start()
+        algoritmo(pares[0][0], pares[0][1], cidades, SILENCIOSO)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    # Sem consultas, as médias ficam em zero
+    quantidade = len(pares) or 1
+    return {
+        'algoritmo': nome,
+        'consultas': len(pares),
+        'encontrados': encontrados,
+        'tempo_total': tempo,
+        'tempo_medio': tempo / quantidade,
+        'expandidos_medio': contador.expandidos / quantidade,
+        'relaxados_medio': contador.relaxados / quantidade,
+        'maior_fronteira': contador.maior_fronteira,
+        'pico_memoria': pico,
+    }
+
+
+def rodar(geradores: list, tamanhos: list, algoritmos: list, consultas: int, semente: int):
+    """
+    Gera cada mapa, sorteia os pares de consulta e mede cada algoritmo.
+
+    :return: lista de resultados, um por (gerador, tamanho, algoritmo)
+    """
+    resultados = list()
+    for gerador in geradores:
+        for tamanho in tamanhos:
+            inicio = time.perf_counter()
+            cidades = GERADORES[gerador](tamanho, semente)
+            construcao = time.perf_counter() - inicio
+
+            sorteio = random.Random(semente)
+            pares = [sorteio.sample(cidades, 2) for _ in range(consultas)]
+
+            for nome in algoritmos:
+                if len(cidades) > TAMANHO_MAXIMO.get(nome, inf):
+                    continue
+                resultado = medir(nome, cidades, pares)
+                resultado.update({'gerador': gerador, 'cidades': len(cidades), 'construcao': construcao})
+                resultados.append(resultado)
+                print("%-16s %8d %-24s %10.3fms %10.0f expandidos %10.0fKB" % (
+                    gerador, len(cidades), nome, resultado['tempo_medio'] * 1000,
+                    resultado['expandidos_medio'], resultado['pico_memoria'] / 1024))
+    return resultados
+
+
+def comparar(resultados: list, anteriores: list, tolerancia: float):
+    """
+    Compara o tempo médio com o de uma execução anterior e lista as regressões,
+    ou seja, os casos que ficaram mais lentos do que a tolerância permite.
+
+    :return: lista de textos descrevendo cada regressão
+    """
+    chave = lambda r: (r['gerador'], r['cidades'], r['algoritmo'])
+    antes = {chave(r): r for r in anteriores}
+    regressoes = list()
+    for resultado in resultados:
+        anterior = antes.get(chave(resultado))
+        if anterior is None or not anterior['tempo_medio']:
+            continue
+        razao = resultado['tempo_medio'] / anterior['tempo_medio']
+        if razao > 1 + tolerancia:
+            regressoes.append("%s %d %s: %.3fms -> %.3fms (%+.0f%%)" % (
+                *chave(resultado), anterior['tempo_medio'] * 1000, resultado['tempo_medio'] * 1000,
+                (razao - 1) * 100))
+    return regressoes
+
+
+if __name__ == "__main__":
+    """
+    Exemplos:
+    python benchmark.py --saida resultados.json
+    python benchmark.py --tamanhos 100 1000 10000 100000 1000000 --algoritmos astar dijkstra
+    python benchmark.py --saida nova.json --comparar resultados.json
+    """
+    parser = argparse.ArgumentParser(description="Mede o tempo, a memória e as expansões de cada busca.")
+    parser.add_argument('--geradores', nargs='+', choices=GERADORES, default=list(GERADORES))
+    parser.add_argument('--tamanhos', nargs='+', type=int, default=[100, 1000, 10000])
+    parser.add_argument('--algoritmos', nargs='+', choices=ALGORITMOS, default=list(ALGORITMOS))
+    parser.add_argument('--consultas', type=int, default=20)
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--saida', help="arquivo JSON onde os resultados são gravados")
+    parser.add_argument('--comparar', help="arquivo JSON de uma execução anterior")
+    parser.add_argument('--tolerancia', type=float, default=0.2,
+                        help="quanto mais lento (fração) ainda não conta como regressão")
+    argumentos = parser.parse_args()
+
+    resultados = rodar(argumentos.geradores, argumentos.tamanhos, argumentos.algoritmos,
+                       argumentos.consultas, argumentos.semente)
+
+    if argumentos.saida:
+        with open(argumentos.saida, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'plataforma': platform.platform(),
+                'semente': argumentos.semente,
+                'resultados': resultados,
+            }, f, indent=2)
+
+    if argumentos.comparar:
+        with open(argumentos.comparar) as f:
+            anteriores = json.load(f)['resultados']
+        regressoes = comparar(resultados, anteriores, argumentos.tolerancia)
+        for regressao in regressoes:
+            print("REGRESSÃO:", regressao)
+        if regressoes:
+            sys.exit(1)
@@ -1,264 +1,633 @@
 from classes import *
+from rastreio import *
 from collections import deque as fila
+from itertools import count
+import heapq
 from math import inf
 
 
-def breadth_first(origem: Cidade, destino: Cidade):
+def vizinhos_com_custo(cidade: Cidade, grafo=None, reverso: bool = False):
+    """
+    Retorna os vizinhos da cidade no formato [ [custo0, vizinho0], [custo1, vizinho1], ... ]
+    Se grafo (um GrafoCompacto) for informado, os vizinhos são lidos dos arrays dele,
+    sem passar pelas estradas da cidade.
+    Se reverso, retorna as cidades de onde se chega nesta (para buscar de trás pra
+    frente); só faz diferença quando há estradas de mão única.
+    """
+    if grafo is None:
+        return cidade.antecessores_com_custo if reverso else cidade.vizinhos_com_custo
+    return grafo.vizinhos_com_custo(cidade, reverso)
+
+
+"""
+Todas as buscas rodam em silêncio. Para acompanhar o que acontece, passe um
+rastreador (veja rastreio.py): Impressora mostra as cidades visitadas,
+Contador só conta expansões, relaxamentos, tamanho da fronteira e tempo, e
+medir_busca devolve, junto com o resultado, as Metricas da busca (que também
+podem medir a memória e ligar um profiler por amostragem, o Amostrador).
+"""
+
+
+def reachable(origem: Cidade, destino: Cidade, grafo=None):
+    """
+    Diz se existe algum caminho entre origem e destino, sem buscar: os componentes
+    conexos já estão calculados (nas cidades, ou no GrafoCompacto, se informado).
+    Todas as buscas perguntam isso antes de começar, então uma consulta impossível
+    retorna na hora em vez de percorrer todo o componente da origem.
+
+    Os componentes não olham a direção das estradas de mão única: False é garantido,
+    mas True só diz que as cidades estão ligadas, talvez só no sentido contrário.
+    """
+    if grafo is not None:
+        return grafo.alcanca(grafo.indice(origem), grafo.indice(destino))
+    return origem.componente() is destino.componente()
+
+
+def montar_trilha(anteriores: dict, custos: dict, destino: Cidade):
+    """
+    Monta a Trilha até o destino a partir do dicionário de anteriores
+    (cidade -> cidade de onde viemos; None na origem) e do custo acumulado até cada cidade.
+    Assim as buscas só criam objetos Trilha para o caminho que interessa.
+
+    :return: Trilha, ou None se o destino não foi alcançado
+    """
+    if destino not in anteriores:
+        return None
+
+    caminho = [destino]
+    while anteriores[caminho[-1]] is not None:
+        caminho.append(anteriores[caminho[-1]])
+
+    trilha = None
+    for cidade in reversed(caminho):
+        trilha = Trilha(cidade, trilha, custos[cidade])
+    return trilha
+
+
+def breadth_first(origem: Cidade, destino: Cidade, grafo=None, rastreador: Rastreador = SILENCIOSO):
     """
     Parte da origem, e realiza busca em largura até chegar no destino.
 
     :return: Trilha
     """
-    visitados = set()
-    trilhas = {origem: Trilha(origem)}
+    """
+    Cada cidade descoberta entra em anteriores no momento em que entra na fila,
+    então anteriores também serve de conjunto de visitados
+    """
+    if not reachable(origem, destino, grafo):
+        return None
+
+    anteriores = {origem: None}
+    custos = {origem: 0}
     fifo = fila()
 
+    rastreador.inicio()
     fifo.append(origem)
 
-    while len(fifo):
+    while fifo:
         atual = fifo.popleft()
-        print("visitando ", atual)
+        rastreador.desempilha(atual)
+        rastreador.visita(atual)
 
         if atual == destino:
             break
 
-        if atual not in visitados:
-            visitados.add(atual)
-
-        trilha_atual = trilhas[atual]
-
-        for vizinho_com_custo in atual.vizinhos_com_custo:
-            vizinho = vizinho_com_custo[1]
-            if vizinho in visitados or vizinho in fifo:
+        custo_atual = custos[atual]
+        for custo, vizinho in vizinhos_com_custo(atual, grafo):
+            if vizinho in anteriores:
                 continue
 
+            anteriores[vizinho] = atual
+            custos[vizinho] = custo_atual + custo
             fifo.append(vizinho)
-            visitados.add(vizinho)
-            nova_trilha = Trilha(vizinho, trilha_atual, vizinho_com_custo[0] + trilha_atual.custo)
-            trilhas[vizinho] = nova_trilha
+            rastreador.relaxa(atual, vizinho, custos[vizinho])
+            rastreador.empilha(vizinho, len(fifo))
 
-    return trilhas.get(destino)
+    rastreador.fim()
+    return montar_trilha(anteriores, custos, destino)
 
 
-def greedy_best_first(origem: Cidade, destino: Cidade):
+def estimador(heuristica, destino):
     """
-    Parte da origem, e realiza greedy best first search até chegar no destino.
+    Retorna uma função estimar(cidade) com a estimativa da cidade até o destino.
+    Heurísticas que calculam tudo de uma vez (como HeuristicaVetorizada, de
+    heuristicas.py) têm o método para_destino, e aí a busca só consulta a tabela.
+    """
+    if hasattr(heuristica, 'para_destino'):
+        return heuristica.para_destino(destino)
+    return lambda cidade: heuristica(cidade, destino)
+
+
+def greedy_best_first(origem: Cidade, destino: Cidade, grafo=None, rastreador: Rastreador = SILENCIOSO,
+                      heuristica=None, largura_feixe: int = None):
+    """
+    Parte da origem, e realiza greedy best first search até chegar no destino:
+    sempre expande, entre todas as cidades descobertas, a que parece estar mais
+    perto do destino, sem olhar para o custo do caminho até ela.
+
+    A heurística é uma função heuristica(cidade, destino), e por padrão é
+    Cidade.estimativa (respeita a implementação da cidade: manhattan ou arquivo).
+    Se largura_feixe for informado, a fronteira fica limitada a essa quantidade de
+    cidades, descartando as piores (beam search). Fica mais rápido e gasta menos
+    memória, mas pode não achar o destino mesmo que exista caminho.
 
     :return: Trilha
     """
-    visitados = set()
-    trilhas = {origem: Trilha(origem)}
-    fifo = fila()
+    if not reachable(origem, destino, grafo):
+        return None
+    if heuristica is None:
+        heuristica = Cidade.estimativa
+    estimar = estimador(heuristica, destino)
 
-    fifo.append(origem)
+    anteriores = {origem: None}
+    custos = {origem: 0}
 
-    while len(fifo):
-        atual = fifo.popleft()
-        print("visitando ", atual)
+    rastreador.inicio()
+    ordem = count()
+    fronteira = FilaPrioridade([[estimar(origem), next(ordem), origem]])
+
+    while fronteira:
+        _, _, atual = fronteira.pop()
+        rastreador.desempilha(atual)
+        rastreador.visita(atual)
 
         if atual == destino:
             break
 
-        if atual not in visitados:
-            visitados.add(atual)
-
-        visitados.add(atual)
-        trilha_atual = trilhas[atual]
-
-        """
-        A única diferença deste para a busca em largura é que ordenamos os vizinhos pela distância
-        até o destino. Assim, sempre vamos preferir ir para o próximo vizinho que parece estar mais
-        próximo do destino
-        """
-        vizinhos_ordenados = sorted(atual.vizinhos_com_custo, key=lambda x: x[1].distancia_estimada(destino))
-        for vizinho_com_custo in vizinhos_ordenados:
-            vizinho = vizinho_com_custo[1]
-            if vizinho in visitados or vizinho in fifo:
+        custo_atual = custos[atual]
+        for custo, vizinho in vizinhos_com_custo(atual, grafo):
+            if vizinho in anteriores:
                 continue
 
-            fifo.append(vizinho)
-            visitados.add(vizinho)
-            nova_trilha = Trilha(vizinho, trilha_atual, vizinho_com_custo[0] + trilha_atual.custo)
-            trilhas[vizinho] = nova_trilha
+            anteriores[vizinho] = atual
+            custos[vizinho] = custo_atual + custo
+            rastreador.relaxa(atual, vizinho, custos[vizinho])
+            fronteira.add([estimar(vizinho), next(ordem), vizinho])
+            rastreador.empilha(vizinho, len(fronteira))
 
-    return trilhas.get(destino)
+        if largura_feixe is not None and len(fronteira) > largura_feixe:
+            fronteira = FilaPrioridade(heapq.nsmallest(largura_feixe, fronteira.heap))
+
+    rastreador.fim()
+    return montar_trilha(anteriores, custos, destino)
+
+
+def trilha_do_caminho(caminho: list, custos: list):
+    """Monta a Trilha a partir da lista de cidades do caminho e do custo acumulado até cada uma"""
+    trilha = None
+    for cidade, custo in zip(caminho, custos):
+        trilha = Trilha(cidade, trilha, custo)
+    return trilha
+
+
+def busca_limitada(origem, destino, limite=0, grafo=None, rastreador: Rastreador = SILENCIOSO,
+                   tamanho_tabela: int = None):
+    """
+    Busca em profundidade com limite de profundidade, usando uma pilha explícita em vez
+    de recursão (não estoura o limite de recursão do python em mapas grandes).
+    A origem está no nível 1, e cidades no nível limite não são expandidas.
+    Se limite = 0, não há limite.
+
+    A tabela de transposição guarda o menor nível em que cada cidade já foi alcançada:
+    se a chegarmos de novo num nível igual ou maior, não há nada de novo para ver ali.
+    Se tamanho_tabela for informado, a tabela para de receber cidades novas quando enche,
+    e a memória usada fica limitada a ela mais o caminho atual.
+
+    :return: (Trilha ou None, cortou), onde cortou diz se alguma cidade deixou de ser
+    expandida por causa do limite (se não, aumentar o limite não adianta)
+    """
+    if not reachable(origem, destino, grafo):
+        return None, False
+
+    rastreador.inicio()
+    if origem == destino:
+        rastreador.fim()
+        return Trilha(origem), False
 
+    caminho = [origem]
+    custos = [0]
+    no_caminho = {origem}
+    tabela = {origem: 1}
+    cortou = False
 
-def depth_limited(origem, destino, limite=0):
+    """
+    pilha[i] percorre os vizinhos de caminho[i]. Quando os vizinhos acabam,
+    a cidade sai do caminho (volta um nível). Só contam como visitadas as cidades
+    cujos vizinhos chegam a ser gerados, e não as cortadas pelo limite.
+    """
+    pilha = list()
+    if limite and limite <= 1:
+        cortou = True
+    else:
+        rastreador.visita(origem)
+        pilha.append(iter(list(vizinhos_com_custo(origem, grafo))))
+
+    while pilha:
+        proximo = next(pilha[-1], None)
+        if proximo is None:
+            rastreador.desempilha(caminho[-1])
+            pilha.pop()
+            no_caminho.remove(caminho.pop())
+            custos.pop()
+            continue
+
+        custo, vizinho = proximo
+        nivel = len(caminho) + 1
+        if vizinho in no_caminho or tabela.get(vizinho, inf) <= nivel:
+            continue
+        if tamanho_tabela is None or len(tabela) < tamanho_tabela or vizinho in tabela:
+            tabela[vizinho] = nivel
+
+        novo_custo = custos[-1] + custo
+        rastreador.relaxa(caminho[-1], vizinho, novo_custo)
+
+        if vizinho == destino:
+            rastreador.fim()
+            return trilha_do_caminho(caminho + [vizinho], custos + [novo_custo]), cortou
+
+        if limite and nivel >= limite:
+            cortou = True
+            continue
+
+        rastreador.visita(vizinho)
+        caminho.append(vizinho)
+        custos.append(novo_custo)
+        no_caminho.add(vizinho)
+        pilha.append(iter(list(vizinhos_com_custo(vizinho, grafo))))
+        rastreador.empilha(vizinho, len(pilha))
+
+    rastreador.fim()
+    return None, cortou
+
+
+def depth_limited(origem, destino, limite=0, grafo=None, rastreador: Rastreador = SILENCIOSO,
+                  tamanho_tabela: int = None):
     """
     Depth Limited Search (DLS): busca em profundidade (depth-first search, DFS)
     com limite de profundidade. Se limite = 0, torna-se DFS.
 
     :return: Trilha
     """
-    visitados = set()
-    custo_acumulado = {origem: 0}
+    return busca_limitada(origem, destino, limite, grafo, rastreador, tamanho_tabela)[0]
 
-    def visitar(cidade: Cidade, trilha: Trilha = None, nivel=1):
-        """Parte recursiva da busca em profundidade. É definida aqui para
-        poder ter acesso ao destino, a visitados e a custo_acumulado.
-        Se nivel for igual a limite, a busca é interrompida
-        """
 
-        print("visitando ", cidade)
-
-        # Serve apenas pra permitir que o usuário não precise passar uma trilha no começo
-        if trilha is None:
-            trilha = Trilha(cidade)
-
-        """ Condições de parada
-        Se encontramos o destino
-        Se já visitamos a cidade
-        Se alcançamos o limite de profundidade
-        """
-        if cidade == destino:
-            return trilha
-        if cidade in visitados:
-            return None
-        if nivel >= limite and limite:
-            return None
-
-        visitados.add(cidade)
-
-        """
-        Atualizamos o custo acumulado até cada vizinho: calculamos o novo custo.
-        Se o novo custo for menor que o custo atual, atualizamos o custo
-        """
-        custo_atual = custo_acumulado[cidade]
-        for vizinho in cidade.vizinhos_com_custo:
-            novo_custo = custo_atual + vizinho[0]
-            if vizinho[1] not in custo_acumulado or novo_custo < custo_acumulado[vizinho[1]]:
-                custo_acumulado[vizinho[1]] = novo_custo
-
-        """
-        Para cada vizinho (primeiro o da direita, último o da esquerda), aumente
-        a profundidade. Se um dos filhos levou ao destino, os filhos seguintes são ignorados
-        """
-
-        for vizinho in cidade.vizinhos:
-            resultado = visitar(vizinho, Trilha(vizinho, trilha, custo_acumulado[vizinho]), nivel+1)
-            if resultado:
-                return resultado
+def iterative_deepening(origem, destino, limite=100, grafo=None, rastreador: Rastreador = SILENCIOSO,
+                        tamanho_tabela: int = None):
+    """
+    Realiza Depth Limited Search com limites cada vez maiores, até chegar na resposta.
+    Se numa rodada nenhuma cidade foi cortada pelo limite, a busca já viu tudo o que
+    dava para alcançar, e as próximas rodadas não são feitas.
+    """
+    if not reachable(origem, destino, grafo):
         return None
 
-    return visitar(origem)
+    rastreador.inicio()
+    resultado = None
+    for d in range(1, limite + 1):
+        rastreador.profundidade(d)
+        resultado, cortou = busca_limitada(origem, destino, d, grafo, rastreador, tamanho_tabela)
+        if resultado or not cortou:
+            break
+    rastreador.fim()
+    return resultado
 
 
-def iterative_deepening(origem, destino, limite=100):
+def ida_star(origem, destino, grafo=None, heuristica=None, rastreador: Rastreador = SILENCIOSO,
+             tamanho_tabela: int = None):
     """
-    Realiza Depth Limited Search com limites cada vez maiores, até chegar na resposta.
+    IDA* (iterative deepening A*): buscas em profundidade sucessivas, mas o limite é
+    sobre f = g + h, e não sobre a profundidade. Cada rodada usa como limite o menor f
+    que passou do limite da rodada anterior. Com uma heurística que nunca superestima,
+    o caminho encontrado é o de menor custo.
+
+    Só guarda o caminho atual (pilha explícita) e a tabela de transposição, que lembra
+    o menor g com que cada cidade foi alcançada na rodada. Com tamanho_tabela, a tabela
+    para de crescer ao encher: é a alternativa ao A* quando a fronteira não cabe na memória.
+
+    A heurística é uma função heuristica(cidade, destino), e por padrão é Cidade.estimativa.
+
+    :return: Trilha
     """
-    for d in range(1, limite + 1):
-        print("Tentando com profundidade máxima de ", d)
-        resultado = depth_limited(origem, destino, d)
+    if not reachable(origem, destino, grafo):
+        return None
+    if heuristica is None:
+        heuristica = Cidade.estimativa
+
+    rastreador.inicio()
+    limite_f = heuristica(origem, destino)
+    resultado = None
+
+    while limite_f < inf:
+        rastreador.profundidade(limite_f)
+        proximo_limite = inf
+
+        rastreador.visita(origem)
+        if origem == destino:
+            resultado = Trilha(origem)
+            break
+
+        caminho = [origem]
+        custos = [0]
+        no_caminho = {origem}
+        tabela = {origem: 0}
+        pilha = [iter(list(vizinhos_com_custo(origem, grafo)))]
+
+        while pilha:
+            proximo = next(pilha[-1], None)
+            if proximo is None:
+                rastreador.desempilha(caminho[-1])
+                pilha.pop()
+                no_caminho.remove(caminho.pop())
+                custos.pop()
+                continue
+
+            custo, vizinho = proximo
+            novo_custo = custos[-1] + custo
+            if vizinho in no_caminho or tabela.get(vizinho, inf) <= novo_custo:
+                continue
+
+            f = novo_custo + heuristica(vizinho, destino)
+            if f > limite_f:
+                # Fica para a próxima rodada
+                if f < proximo_limite:
+                    proximo_limite = f
+                continue
+
+            if tamanho_tabela is None or len(tabela) < tamanho_tabela or vizinho in tabela:
+                tabela[vizinho] = novo_custo
+            rastreador.relaxa(caminho[-1], vizinho, novo_custo)
+            rastreador.visita(vizinho)
+
+            if vizinho == destino:
+                resultado = trilha_do_caminho(caminho + [vizinho], custos + [novo_custo])
+                break
+
+            caminho.append(vizinho)
+            custos.append(novo_custo)
+            no_caminho.add(vizinho)
+            pilha.append(iter(list(vizinhos_com_custo(vizinho, grafo))))
+            rastreador.empilha(vizinho, len(pilha))
+
         if resultado:
-            return resultado
+            break
+        limite_f = proximo_limite
+
+    rastreador.fim()
+    return resultado
 
 
-def astar(origem, destino):
+def astar(origem, destino, grafo=None, heuristica=None, estatisticas: dict = None,
+          rastreador: Rastreador = SILENCIOSO):
     """
     Realiza busca de uma trilha entre origem e destino considerando o caminho
-    percorrido e a heurística, que é a estimativa de distância até o destino
+    percorrido e a heurística, que é a estimativa de distância até o destino.
+
+    A heurística é uma função heuristica(cidade, destino). Por padrão usamos
+    Cidade.estimativa, mas dá pra passar, por exemplo, Cidade.distancia_estimada,
+    ou uma HeuristicaVetorizada (heuristicas.py).
+    Se estatisticas (um dicionário) for passado, preenchemos nele quantas cidades
+    foram expandidas e quantas precisaram ser reabertas.
 
     :return: Trilha
     """
-    visitados = set()
-    custo_acumulado = {origem: 0}
+    if not reachable(origem, destino, grafo):
+        if estatisticas is not None:
+            estatisticas['expandidos'] = 0
+            estatisticas['reabertos'] = 0
+        return None
+    if heuristica is None:
+        heuristica = Cidade.estimativa
+    estimar = estimador(heuristica, destino)
 
-    def visitar(cidade: Cidade, trilha: Trilha = None):
-        """Parte recursiva da busca em profundidade. É definida aqui para
-        poder ter acesso ao destino, a visitados e a custo_acumulado.
-        """
+    trilhas = {origem: Trilha(origem)}
+    fechados = set()
+    expandidos = 0
+    reabertos = 0
 
-        print("visitando ", cidade)
+    """
+    A fronteira guarda entradas no formato [f, h, ordem, g, cidade], onde
+    f = g + h é o custo total estimado. Em caso de empate no f, preferimos o menor h
+    (a cidade que parece mais perto do destino) e depois a que entrou primeiro.
+    Entradas antigas (com g maior que o melhor conhecido) são ignoradas quando saem.
+    """
+    rastreador.inicio()
+    ordem = count()
+    h = estimar(origem)
+    fronteira = FilaPrioridade([[h, h, next(ordem), 0, origem]])
 
-        # Serve apenas pra permitir que o usuário não precise passar uma trilha no começo
-        if trilha is None:
-            trilha = Trilha(cidade)
+    while fronteira:
+        _, _, _, custo_atual, cidade = fronteira.pop()
+        rastreador.desempilha(cidade)
+        if custo_atual > trilhas[cidade].custo or cidade in fechados:
+            continue
+
+        rastreador.visita(cidade)
+        expandidos += 1
 
-        """ Condições de parada
-        Se encontramos o destino
-        Se já visitamos a cidade
-        """
         if cidade == destino:
-            return trilha
-        if cidade in visitados:
-            return None
-
-        visitados.add(cidade)
-
-        """
-        Atualizamos o custo acumulado até cada vizinho: calculamos o novo custo.
-        Se o novo custo for menor que o custo atual, atualizamos o custo
-        """
-        custo_atual = custo_acumulado[cidade]
-        for vizinho in cidade.vizinhos_com_custo:
-            novo_custo = custo_atual + vizinho[0]
-            if vizinho[1] not in custo_acumulado or novo_custo < custo_acumulado[vizinho[1]]:
-                custo_acumulado[vizinho[1]] = novo_custo
-
-        """
-        Montamos a fila de prioridade, onde a primeira é aquela que tem o menor custo total
-        e o custo total é o custo até a cidade + a estimativa do que falta até o destino
-        """
-        fila_prioridade = cidade.vizinhos_com_estimativa(destino)
-        for c in fila_prioridade:
-            c[0] = c[0] + custo_acumulado[c[1]]
-
-        fila_prioridade = FilaPrioridade(fila_prioridade)
-
-        """
-        Para cada vizinho (em ordem de prioridade, ou seja, melhores candidatos primeiro)
-        Se um dos filhos levou ao destino, os filhos seguintes são ignorados
-        """
-        while fila_prioridade:
-            vizinho = fila_prioridade.pop()
-
-            if not vizinho:
-                break
-            else:
-                vizinho = vizinho[1]
+            break
+
+        fechados.add(cidade)
+        trilha_atual = trilhas[cidade]
 
-            if vizinho in visitados:
+        for custo, vizinho in vizinhos_com_custo(cidade, grafo):
+            novo_custo = custo_atual + custo
+            if vizinho in trilhas and novo_custo >= trilhas[vizinho].custo:
                 continue
 
-            resultado = visitar(vizinho, Trilha(vizinho, trilha, custo_acumulado[vizinho]))
+            """
+            Achamos um caminho melhor até o vizinho. Se ele já tinha sido fechado
+            (o que só acontece com heurísticas inconsistentes), ele é reaberto
+            """
+            if vizinho in fechados:
+                fechados.remove(vizinho)
+                reabertos += 1
+
+            trilhas[vizinho] = Trilha(vizinho, trilha_atual, novo_custo)
+            rastreador.relaxa(cidade, vizinho, novo_custo)
+            h = estimar(vizinho)
+            fronteira.add([novo_custo + h, h, next(ordem), novo_custo, vizinho])
+            rastreador.empilha(vizinho, len(fronteira))
+
+    rastreador.fim()
+    if estatisticas is not None:
+        estatisticas['expandidos'] = expandidos
+        estatisticas['reabertos'] = reabertos
 
-            if resultado:
-                return resultado
-        return None
-
-    return visitar(origem)
+    return trilhas.get(destino)
 
 
-def dijkstra(origem, cidades):
+def dijkstra(origem, cidades, destino=None, grafo=None, rastreador: Rastreador = SILENCIOSO):
     """
     Realiza Dijkstra para retornar o melhor caminho até cada uma de todas as cidades.
+    Se destino for informado, a busca é interrompida assim que o destino é acomodado;
+    nesse caso, as trilhas das cidades ainda não acomodadas podem não ser as melhores.
     """
 
     """
     Abaixo, montamos um dicionário no formato
-    { origem: 1, cidade1: inf, cidade2: inf, ... }
-    onde os valores são trilhas com custo total 1, se for a origem, e infinito, se não for
-    """
-    trilhas = {x: Trilha(x, custo=0) if x == origem else Trilha(x, custo=inf) for x in cidades}
-    nao_acomodados = set([x for x in cidades])
-
-    while nao_acomodados:
-        # Precisamos pegar apenas os não acomodados, filtrando:
-        filtrados = {k: trilhas[k] for k in trilhas if k in nao_acomodados}
-        # Na linha abaixo, eu monto uma heap com o estado atual das trilhas, e pego a próxima de menor valor
-        custo_atual, cidade_atual = FilaPrioridade(filtrados).pop()
-        nao_acomodados.remove(cidade_atual)
-
-        for vizinho in cidade_atual.vizinhos_com_custo:
-            novo_custo = custo_atual + vizinho[0]
-            if novo_custo < trilhas[vizinho[1]].custo:
+    { origem: 0, cidade1: inf, cidade2: inf, ... }
+    onde os valores são trilhas com custo total 0, se for a origem, e infinito, se não for
+    """
+    trilhas = {x: Trilha(x, custo=inf) for x in cidades}
+    trilhas[origem] = Trilha(origem, custo=0)
+    acomodados = set()
+
+    # Se o destino não é alcançável, a busca pararia "nele" antes de começar
+    if destino is not None and not reachable(origem, destino, grafo):
+        return trilhas
+
+    """
+    A heap guarda entradas no formato [custo, ordem, cidade]. Quando o custo de uma cidade
+    diminui, não mexemos na entrada antiga: inserimos uma nova, e a antiga é descartada
+    quando sair da heap (remoção preguiçosa). A ordem de inserção serve para desempate.
+    """
+    rastreador.inicio()
+    ordem = count()
+    fila_prioridade = FilaPrioridade([[0, next(ordem), origem]])
+
+    while fila_prioridade:
+        custo_atual, _, cidade_atual = fila_prioridade.pop()
+        rastreador.desempilha(cidade_atual)
+        if cidade_atual in acomodados:
+            continue
+        acomodados.add(cidade_atual)
+        rastreador.visita(cidade_atual)
+
+        if cidade_atual == destino:
+            break
+
+        trilha_atual = trilhas[cidade_atual]
+        for custo, vizinho in vizinhos_com_custo(cidade_atual, grafo):
+            novo_custo = custo_atual + custo
+            if novo_custo < trilhas[vizinho].custo:
                 # Atualizamos trilhas, pegando a trilha até a cidade atual e acrescentando o vizinho
-                trilhas[vizinho[1]] = Trilha(vizinho[1], trilhas[cidade_atual], novo_custo)
+                trilhas[vizinho] = Trilha(vizinho, trilha_atual, novo_custo)
+                rastreador.relaxa(cidade_atual, vizinho, novo_custo)
+                fila_prioridade.add([novo_custo, next(ordem), vizinho])
+                rastreador.empilha(vizinho, len(fila_prioridade))
 
+    rastreador.fim()
     return trilhas
 
+
+def busca_bidirecional(origem, destino, grafo=None, potencial=None, rastreador: Rastreador = SILENCIOSO):
+    """
+    Faz duas buscas ao mesmo tempo, uma partindo da origem e outra partindo do destino,
+    até que elas se encontrem. A busca de trás pra frente segue as estradas ao
+    contrário (vizinhos_com_custo com reverso), por causa das estradas de mão única.
+
+    Se potencial for informado, as chaves da busca da origem são g + potencial(cidade)
+    e as da busca do destino são g - potencial(cidade) (A* bidirecional). Sem potencial,
+    é o Dijkstra bidirecional.
+
+    Paramos quando a soma dos menores valores das duas fronteiras não consegue mais
+    melhorar o melhor caminho encontrado até agora.
+
+    :return: Trilha
+    """
+    if origem == destino:
+        return Trilha(origem)
+    if not reachable(origem, destino, grafo):
+        return None
+    if potencial is None:
+        potencial = lambda cidade: 0
+
+    # Índice 0 é a busca a partir da origem, índice 1 é a busca a partir do destino
+    sinais = (1, -1)
+    trilhas = ({origem: Trilha(origem)}, {destino: Trilha(destino)})
+    fechados = (set(), set())
+    ordem = count()
+    fronteiras = (FilaPrioridade([[potencial(origem), next(ordem), origem]]),
+                  FilaPrioridade([[-potencial(destino), next(ordem), destino]]))
+
+    melhor_custo = inf
+    encontro = None
+
+    rastreador.inicio()
+    while fronteiras[0] and fronteiras[1]:
+        if fronteiras[0].heap[0][0] + fronteiras[1].heap[0][0] >= melhor_custo:
+            break
+
+        # Avançamos o lado que tem a menor fronteira
+        lado = 0 if len(fronteiras[0]) <= len(fronteiras[1]) else 1
+        _, _, cidade = fronteiras[lado].pop()
+        rastreador.desempilha(cidade)
+        if cidade in fechados[lado]:
+            continue
+        fechados[lado].add(cidade)
+        rastreador.visita(cidade)
+
+        trilha_atual = trilhas[lado][cidade]
+        for custo, vizinho in vizinhos_com_custo(cidade, grafo, lado == 1):
+            novo_custo = trilha_atual.custo + custo
+            if vizinho in trilhas[lado] and novo_custo >= trilhas[lado][vizinho].custo:
+                continue
+
+            trilhas[lado][vizinho] = Trilha(vizinho, trilha_atual, novo_custo)
+            rastreador.relaxa(cidade, vizinho, novo_custo)
+            fronteiras[lado].add([novo_custo + sinais[lado] * potencial(vizinho), next(ordem), vizinho])
+            rastreador.empilha(vizinho, len(fronteiras[0]) + len(fronteiras[1]))
+
+            # Se o outro lado já chegou nesse vizinho, temos um caminho completo
+            outra_trilha = trilhas[1 - lado].get(vizinho)
+            if outra_trilha is not None and novo_custo + outra_trilha.custo < melhor_custo:
+                melhor_custo = novo_custo + outra_trilha.custo
+                encontro = vizinho
+    rastreador.fim()
+
+    if encontro is None:
+        return None
+
+    """
+    Juntamos as duas metades: a trilha da origem até o ponto de encontro, e depois
+    a trilha do destino até o ponto de encontro, percorrida ao contrário
+    """
+    trilha = trilhas[0][encontro]
+    volta = trilhas[1][encontro].anterior
+    while volta:
+        trilha = Trilha(volta.cidade, trilha, melhor_custo - volta.custo)
+        volta = volta.anterior
+    return trilha
+
+
+def bidirectional_dijkstra(origem, destino, grafo=None, rastreador: Rastreador = SILENCIOSO):
+    """
+    Dijkstra de ponto a ponto, buscando a partir da origem e do destino ao mesmo tempo.
+
+    :return: Trilha
+    """
+    return busca_bidirecional(origem, destino, grafo, rastreador=rastreador)
+
+
+def bidirectional_astar(origem, destino, grafo=None, heuristica=None, rastreador: Rastreador = SILENCIOSO,
+                        heuristica_reversa=None):
+    """
+    A* bidirecional. As duas buscas usam o potencial médio
+    (h(cidade, destino) - h'(cidade, origem)) / 2, que mantém o critério de parada
+    correto quando a heurística é consistente.
+
+    A heurística precisa servir para qualquer par de cidades, porque a busca de trás
+    pra frente estima a distância da origem até cada cidade (h'). Por isso o padrão é
+    Cidade.distancia_estimada, e não as estimativas fornecidas no arquivo.
+
+    Com estradas de mão única, a distância de a até b pode não ser a mesma de b até a.
+    heuristica_reversa(cidade, origem) deve estimar a distância da origem até a cidade;
+    se não for informada, usamos o método estimativa_reversa do objeto da heurística
+    (como em marcos.Marcos), ou a própria heurística, que serve se ela for simétrica.
+
+    :return: Trilha
+    """
+    if heuristica is None:
+        heuristica = Cidade.distancia_estimada
+    if heuristica_reversa is None:
+        heuristica_reversa = getattr(getattr(heuristica, '__self__', None), 'estimativa_reversa', heuristica)
+
+    def potencial(cidade):
+        return (heuristica(cidade, destino) - heuristica_reversa(cidade, origem)) / 2
+
+    return busca_bidirecional(origem, destino, grafo, potencial, rastreador)
+
     
 if __name__ == "__main__":
     A = Cidade('A', (0, 0), implementacao="manhattan")    # C -- D
@@ -295,17 +664,29 @@ if __name__ == "__main__":
     print("\nBuscando um caminho entre %s e %s\n" % (A, D))
 
     print("---\n--- BREADTH-FIRST SEARCH\n---")
-    retorno = breadth_first(A, D)
+    retorno = breadth_first(A, D, rastreador=Impressora())
     print("%s (custo %.0f)" % (retorno, retorno.custo))
 
     print("---\n--- ITERATIVE DEEPENING SEARCH\n---")
-    retorno = iterative_deepening(A, D)
+    retorno = iterative_deepening(A, D, rastreador=Impressora())
     print("%s (custo %.0f)" % (retorno, retorno.custo))
 
     print("---\n--- GREEDY BEST FIRST SEARCH\n---")
-    retorno = greedy_best_first(A, D)
+    retorno = greedy_best_first(A, D, rastreador=Impressora())
+    print("%s (custo %.0f)" % (retorno, retorno.custo))
+
+    print("---\n--- IDA-STAR (IDA*)\n---")
+    retorno = ida_star(A, D, rastreador=Impressora())
     print("%s (custo %.0f)" % (retorno, retorno.custo))
 
     print("---\n--- A-STAR (A*)\n---")
-    retorno = astar(A, D)
+    retorno = astar(A, D, rastreador=Impressora())
+    print("%s (custo %.0f)" % (retorno, retorno.custo))
+
+    print("---\n--- BIDIRECTIONAL DIJKSTRA\n---")
+    retorno = bidirectional_dijkstra(A, D, rastreador=Impressora())
+    print("%s (custo %.0f)" % (retorno, retorno.custo))
+
+    print("---\n--- BIDIRECTIONAL A-STAR\n---")
+    retorno = bidirectional_astar(A, D, rastreador=Impressora())
     print("%s (custo %.0f)" % (retorno, retorno.custo))
@@ -0,0 +1,181 @@
+from buscas import *
+from collections import OrderedDict
+
+"""
+Buscas que sempre retornam o caminho de menor custo. Para elas, uma árvore do
+Dijkstra já calculada a partir da mesma origem responde por qualquer destino.
+"""
+OTIMAS = {astar, dijkstra, bidirectional_dijkstra, bidirectional_astar, ida_star}
+
+
+class CacheRotas:
+    """
+    Guarda as trilhas já calculadas, para que a mesma consulta (algoritmo, origem,
+    destino, heurística) não precise ser refeita. Quando passa do tamanho, as consultas
+    usadas há mais tempo são descartadas (LRU).
+
+    Também guarda árvores do Dijkstra por origem: qualquer consulta de uma busca ótima
+    a partir de uma origem que já tem árvore é respondida por ela.
+
+    Cada resultado é guardado junto com a versão do componente da origem (veja
+    Cidade.versao). Se alguma estrada desse componente for criada, alterada ou
+    removida, o resultado é descartado quando for consultado de novo; estradas de
+    outros mapas (ou de outros componentes) não atrapalham. Se o cache for montado
+    sobre um GrafoCompacto, que não muda, isso não é necessário, mas também não atrapalha.
+    """
+    # cidades do mapa (para o Dijkstra)
+    cidades = None
+    # GrafoCompacto usado nas buscas (opcional)
+    grafo = None
+    # quantidade máxima de trilhas e de árvores guardadas
+    tamanho = None
+    tamanho_arvores = None
+    # (algoritmo, origem, destino, heuristica) -> (versão, Trilha)
+    trilhas = None
+    # origem -> (versão, resultado do dijkstra)
+    arvores = None
+    # métricas
+    acertos = None
+    acertos_arvore = None
+    falhas = None
+    descartes = None
+    invalidacoes = None
+
+    def __init__(self, cidades: list, tamanho: int = 1024, tamanho_arvores: int = 16, grafo=None):
+        self.cidades = cidades
+        self.grafo = grafo
+        self.tamanho = tamanho
+        self.tamanho_arvores = tamanho_arvores
+        self.trilhas = OrderedDict()
+        self.arvores = OrderedDict()
+        self.acertos = 0
+        self.acertos_arvore = 0
+        self.falhas = 0
+        self.descartes = 0
+        self.invalidacoes = 0
+
+    def limpar(self):
+        """Descarta tudo o que foi guardado"""
+        self.trilhas.clear()
+        self.arvores.clear()
+
+    def buscar(self, guardados: OrderedDict, chave, versao: int):
+        """
+        Procura a chave. Se ela foi guardada numa versão velha do componente, não vale mais e é descartada.
+
+        :return: (versão, valor), ou None se não estiver guardada
+        """
+        guardado = guardados.get(chave)
+        if guardado is None:
+            return None
+        if guardado[0] != versao:
+            del guardados[chave]
+            self.invalidacoes += 1
+            return None
+        guardados.move_to_end(chave)
+        return guardado
+
+    def guardar(self, guardados: OrderedDict, chave, valor, tamanho: int):
+        """Guarda o valor e descarta o usado há mais tempo se passar do tamanho"""
+        guardados[chave] = valor
+        guardados.move_to_end(chave)
+        while len(guardados) > tamanho:
+            guardados.popitem(last=False)
+            self.descartes += 1
+
+    def arvore(self, origem: Cidade):
+        """
+        Resultado do dijkstra a partir da origem ({cidade: Trilha}), calculado uma vez só
+        """
+        versao = origem.componente().versao
+        guardado = self.buscar(self.arvores, origem, versao)
+        if guardado is not None:
+            self.acertos += 1
+            return guardado[1]
+        self.falhas += 1
+        arvore = dijkstra(origem, self.cidades, grafo=self.grafo)
+        self.guardar(self.arvores, origem, (versao, arvore), self.tamanho_arvores)
+        return arvore
+
+    def rota(self, origem: Cidade, destino: Cidade, algoritmo=astar, heuristica=None):
+        """
+        Trilha entre origem e destino calculada pelo algoritmo (uma das funções de buscas.py).
+        Se heuristica for informada, é repassada ao algoritmo.
+
+        :return: Trilha, ou None se não houver caminho
+        """
+        if algoritmo is dijkstra:
+            trilha = self.arvore(origem).get(destino)
+            return trilha if trilha is not None and trilha.custo < inf else None
+
+        versao = origem.componente().versao
+        chave = (algoritmo, origem, destino, heuristica)
+        guardado = self.buscar(self.trilhas, chave, versao)
+        if guardado is not None:
+            self.acertos += 1
+            return guardado[1]
+
+        guardado = self.buscar(self.arvores, origem, versao) if algoritmo in OTIMAS else None
+        if guardado is not None:
+            self.acertos_arvore += 1
+            trilha = guardado[1].get(destino)
+            return trilha if trilha is not None and trilha.custo < inf else None
+
+        self.falhas += 1
+        argumentos = {'grafo': self.grafo}
+        if heuristica is not None:
+            argumentos['heuristica'] = heuristica
+        trilha = algoritmo(origem, destino, **argumentos)
+        self.guardar(self.trilhas, chave, (versao, trilha), self.tamanho)
+        return trilha
+
+    @property
+    def metricas(self):
+        """Acertos, falhas, descartes e invalidações até agora"""
+        consultas = self.acertos + self.acertos_arvore + self.falhas
+        return {
+            'acertos': self.acertos,
+            'acertos_arvore': self.acertos_arvore,
+            'falhas': self.falhas,
+            'taxa_acerto': (self.acertos + self.acertos_arvore) / consultas if consultas else 0,
+            'descartes': self.descartes,
+            'invalidacoes': self.invalidacoes,
+            'trilhas': len(self.trilhas),
+            'arvores': len(self.arvores),
+        }
+
+    def __repr__(self):
+        return "CacheRotas(%s)" % ", ".join("%s=%s" % item for item in self.metricas.items())
+
+
+if __name__ == "__main__":
+    from geradores import grade
+    import random
+
+    cidades = grade(30, 30)
+    cache = CacheRotas(cidades, tamanho=100)
+    sorteio = random.Random(0)
+
+    # Poucos pares, repetidos muitas vezes
+    pares = [sorteio.sample(cidades, 2) for _ in range(20)]
+    for _ in range(500):
+        origem, destino = sorteio.choice(pares)
+        cache.rota(origem, destino)
+    print(cache)
+
+    # Uma árvore a partir da origem responde para qualquer destino
+    origem = cidades[0]
+    cache.arvore(origem)
+    for destino in cidades[1:50]:
+        cache.rota(origem, destino)
+    print(cache)
+
+    # Estradas de outro mapa não mexem no cache
+    Estrada(Cidade('natal'), Cidade('mossoro'), 280)
+    print(cache.rota(cidades[0], cidades[1]))
+    print(cache)
+
+    # Mudar uma estrada do mapa invalida o que foi guardado para ele
+    cidades[0].estradas[0].comprimento = 100
+    print(cache.rota(cidades[0], cidades[1]))
+    print(cache)
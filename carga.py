@@ -0,0 +1,120 @@
+from main import LeitorInput
+from rastreio import percentil
+import argparse
+import asyncio
+import json
+import random
+import time
+
+
+async def cliente(conexao, pares: list, simultaneas: int, latencias: list):
+    """
+    Manda as consultas por uma conexão, mantendo até simultaneas consultas pendentes.
+    As respostas podem chegar fora de ordem, então cada uma é casada pelo id.
+    """
+    leitor, escritor = await conexao
+    pendentes = dict()
+    vagas = asyncio.Semaphore(simultaneas)
+
+    async def receber():
+        erros = 0
+        for recebidas in range(len(pares)):
+            linha = await leitor.readline()
+            if not linha:
+                # O servidor fechou a conexão: as consultas pendentes (e as que nem foram
+                # mandadas) contam como erro, e quem manda é acordado para parar
+                pendentes.clear()
+                vagas.release()
+                return erros + len(pares) - recebidas
+            resposta = json.loads(linha)
+            enviada = pendentes.pop(resposta.get('id'), None)
+            if enviada is not None:
+                latencias.append(time.perf_counter() - enviada)
+            # Resposta sem id conhecido (o servidor não entendeu o pedido) também é erro
+            if enviada is None or 'erro' in resposta:
+                erros += 1
+            vagas.release()
+        return erros
+
+    recebendo = asyncio.ensure_future(receber())
+    for i, (origem, destino) in enumerate(pares):
+        await vagas.acquire()
+        if recebendo.done():
+            break
+        pendentes[i] = time.perf_counter()
+        escritor.write(json.dumps({'id': i, 'origem': origem, 'destino': destino}).encode() + b'\n')
+        try:
+            await escritor.drain()
+        except ConnectionError:
+            break
+    erros = await recebendo
+    escritor.close()
+    return erros
+
+
+async def estatisticas_servidor(conexao):
+    """Pede as estatísticas ao servidor"""
+    leitor, escritor = await conexao
+    escritor.write(b'{"id": 0, "comando": "estatisticas"}\n')
+    resposta = json.loads(await leitor.readline())
+    escritor.close()
+    return resposta
+
+
+async def gerar_carga(abrir, nomes: list, consultas: int, conexoes: int, simultaneas: int,
+                      origens: int, semente: int):
+    """
+    Sorteia as consultas e as divide entre as conexões. Com origens pequeno, muitas
+    consultas compartilham a origem, e o servidor consegue juntá-las em lotes.
+
+    :return: dicionário com as medidas do cliente e as estatísticas do servidor
+    """
+    sorteio = random.Random(semente)
+    partidas = sorteio.sample(nomes, min(origens, len(nomes))) if origens else nomes
+    pares = [(sorteio.choice(partidas), sorteio.choice(nomes)) for _ in range(consultas)]
+
+    latencias = list()
+    inicio = time.perf_counter()
+    erros = await asyncio.gather(*(cliente(abrir(), pares[i::conexoes], simultaneas, latencias)
+                                   for i in range(conexoes)))
+    decorrido = time.perf_counter() - inicio
+
+    return {
+        'consultas': consultas,
+        'erros': sum(erros),
+        'tempo_total': decorrido,
+        'vazao': consultas / decorrido,
+        'p50_ms': percentil(latencias, 50) * 1000,
+        'p99_ms': percentil(latencias, 99) * 1000,
+        'servidor': await estatisticas_servidor(abrir()),
+    }
+
+
+if __name__ == "__main__":
+    """
+    Exemplos:
+    python carga.py grafo.txt --consultas 10000
+    python carga.py grafo.txt --unix /tmp/rotas.sock --conexoes 8 --origens 5
+    """
+    parser = argparse.ArgumentParser(description="Gerador de carga para o servidor de rotas.")
+    parser.add_argument('arquivo', help="o mesmo grafo.txt do servidor, de onde saem os nomes das cidades")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--unix', help="caminho do socket Unix do servidor")
+    parser.add_argument('--consultas', type=int, default=1000)
+    parser.add_argument('--conexoes', type=int, default=4)
+    parser.add_argument('--simultaneas', type=int, default=32, help="consultas pendentes por conexão")
+    parser.add_argument('--origens', type=int, default=0,
+                        help="sorteia as origens entre só estas tantas cidades (0 para todas)")
+    parser.add_argument('--semente', type=int, default=0)
+    argumentos = parser.parse_args()
+
+    if argumentos.unix:
+        abrir = lambda: asyncio.open_unix_connection(argumentos.unix)
+    else:
+        abrir = lambda: asyncio.open_connection(argumentos.host, argumentos.porta)
+
+    nomes = [cidade.nome for cidade in LeitorInput(argumentos.arquivo).cidades]
+    resultado = asyncio.run(gerar_carga(abrir, nomes, argumentos.consultas, argumentos.conexoes,
+                                        argumentos.simultaneas, argumentos.origens, argumentos.semente))
+    print(json.dumps(resultado, indent=2))
@@ -1,3 +1,4 @@
+from itertools import count
 from typing import Union
 import heapq
 
@@ -39,6 +40,9 @@ class FilaPrioridade:
         else:
             return None
 
+    def __len__(self):
+        return len(self.heap)
+
 
 """
 Tipos de implementação. Se MANHATTAN, as estimativas (heurística) são feitas
@@ -54,32 +58,106 @@ class Cidade:
     Essa classe corresponde ao nó do grafo.
     Ela conhece seus vizinhos através de suas estradas
     E conhece a distância a cada um deles, também através das estradas
+
+    Usa __slots__ (sem __dict__), já que mapas grandes têm milhões de cidades.
+    Cada cidade recebe um id inteiro na criação, usado no hash e na igualdade.
+
+    As cidades também sabem de que componente conexo fazem parte (union-find): cada
+    estrada criada junta os componentes das suas pontas, então saber se existe
+    caminho entre duas cidades é comparar os componentes (veja buscas.reachable).
+    A raiz de cada componente guarda também a versão dele, que muda sempre que uma
+    estrada do componente é criada, alterada ou removida (veja cache.CacheRotas).
+
+    Estradas de mão única ficam em estradas só na origem; no destino, ficam em
+    entradas, que só as buscas de trás pra frente consultam.
     """
-    # coordenadas cartesianas
-    coordenadas = None
-    # estradas para cidades vizinhas
-    estradas = None
-    # identificador unico
-    nome = None
-    # Se vamos calcular estimativas (distancia manhattan) ou apenas consultar
-    # de dados fornecidos
-    implementacao = None
-    # Estimativa informada pelo problema
-    estimativa_fornecida = None
+    __slots__ = (
+        # identificador inteiro, único por cidade criada
+        'id',
+        # coordenadas cartesianas
+        'coordenadas',
+        # estradas para cidades vizinhas (as de mão dupla e as de mão única que saem daqui)
+        'estradas',
+        # estradas de mão única que chegam aqui (uma tupla vazia enquanto não houver nenhuma)
+        'entradas',
+        # nome da cidade
+        'nome',
+        # Se vamos calcular estimativas (distancia manhattan) ou apenas consultar
+        # de dados fornecidos
+        'implementacao',
+        # Estimativa informada pelo problema
+        'estimativa_fornecida',
+        # componente conexo (union-find): a cidade acima desta na árvore do componente,
+        # quantas cidades o componente tem e a versão do componente (só valem na raiz)
+        'pai',
+        'membros',
+        'versao',
+    )
+    # de onde saem os ids
+    ids = count()
+    # de onde saem as versões dos componentes: nenhum valor se repete, então uma
+    # versão guardada nunca volta a valer depois que o componente muda
+    versoes = count(1)
 
     def __init__(self, nome: str, coordenadas: Union[list, tuple] = (0, 0), implementacao: str = ARQUIVO):
+        self.id = next(Cidade.ids)
         self.nome = nome
         self.coordenadas = coordenadas
         self.implementacao = implementacao
         self.estimativa_fornecida = 0
+        self.pai = self
+        self.membros = 1
+        self.versao = 0
 
         self.estradas = list()
+        self.entradas = ()
 
     def conectar(self, estrada: 'Estrada'):
         """Serve para ser chamada na criação de uma estrada.
         Ao criar a estrada, o nó é informado da existência dessa nova estrada"""
         self.estradas.append(estrada)
 
+    def conectar_entrada(self, estrada: 'Estrada'):
+        """Como conectar, mas para uma estrada de mão única que chega nesta cidade"""
+        if not self.entradas:
+            self.entradas = list()
+        self.entradas.append(estrada)
+
+    def desconectar(self, estrada: 'Estrada', entrada: bool = False):
+        """Serve para ser chamada na remoção de uma estrada"""
+        if entrada:
+            self.entradas.remove(estrada)
+        else:
+            self.estradas.remove(estrada)
+
+    def componente(self):
+        """Cidade que representa o componente conexo desta cidade"""
+        cidade = self
+        while cidade.pai is not cidade:
+            # Encurtamos o caminho até a raiz enquanto subimos
+            cidade.pai = cidade.pai.pai
+            cidade = cidade.pai
+        return cidade
+
+    def unir(self, outra: 'Cidade'):
+        """
+        Junta os componentes das duas cidades (o menor fica embaixo do maior)
+
+        :return: a raiz do componente
+        """
+        a, b = self.componente(), outra.componente()
+        if a is b:
+            return a
+        if a.membros < b.membros:
+            a, b = b, a
+        b.pai = a
+        a.membros += b.membros
+        return a
+
+    def mudou(self):
+        """Avisa que alguma estrada do componente desta cidade mudou (nova versão)"""
+        self.componente().versao = next(Cidade.versoes)
+
     def distancia_estimada(self, vizinho: 'Cidade'):
         """Distância Manhattan entre as duas cidades"""
         return abs(self.coordenadas[0] - vizinho.coordenadas[0]) + abs(self.coordenadas[1] - vizinho.coordenadas[1])
@@ -109,6 +187,24 @@ class Cidade:
         """
         return list(map(lambda estrada: [estrada.comprimento, estrada.vizinho(self)], self.estradas))
 
+    @property
+    def chegadas(self):
+        """
+        Retorna as estradas por onde se chega nesta cidade: as de mão dupla e as
+        de mão única que têm esta cidade como destino.
+        """
+        chegadas = [estrada for estrada in self.estradas if not estrada.mao_unica]
+        chegadas.extend(self.entradas)
+        return chegadas
+
+    @property
+    def antecessores_com_custo(self):
+        """
+        Mesmo formato de vizinhos_com_custo, mas com as cidades de onde se chega aqui.
+        Sem estradas de mão única, é igual a vizinhos_com_custo.
+        """
+        return list(map(lambda estrada: [estrada.comprimento, estrada.vizinho(self)], self.chegadas))
+
     def vizinhos_com_estimativa(self, destino: 'Cidade'):
         """
         Retorna a lista de cidades vizinhas com estimativa
@@ -123,14 +219,12 @@ class Cidade:
 
     def __hash__(self):
         """Serve para que a cidade possa ser usada como chave de dicionário ou de conjunto(set)."""
-        return hash(self.nome)
+        return self.id
 
     def __eq__(self, other):
-        """Serve para poder fazer comparação de igualdade da cidade com outra cidade, ou com uma string."""
-        if isinstance(other, str):
-            return other == self.nome
-        elif isinstance(other, Cidade):
-            return other.nome == self.nome
+        """Duas cidades são iguais se têm o mesmo id (uma cópia é igual à original).
+        Para comparar com um nome, use cidade.nome."""
+        return self is other or (isinstance(other, Cidade) and other.id == self.id)
 
     def __lt__(self, other):
         return True
@@ -138,23 +232,55 @@ class Cidade:
 
 class Estrada:
     """Essa classe corresponde à aresta do grafo.
-    Ela conecta duas cidades, e tem um comprimento(custo)."""
-    # identificador unico
-    nome = None
-    # cidades de origem e destino
-    origem = None
-    destino = None
-    # custo
-    comprimento = None
-
-    def __init__(self, origem: Cidade, destino: Cidade, comprimento: Union[int, float] = 0, nome=None):
+    Ela conecta duas cidades, e tem um comprimento(custo).
+    Se for de mão única, só pode ser percorrida da origem para o destino."""
+    __slots__ = (
+        # identificador unico
+        'nome',
+        # cidades de origem e destino
+        'origem',
+        'destino',
+        # custo (leia e altere por comprimento, que avisa o componente quando muda)
+        'custo',
+        # se só pode ser percorrida da origem para o destino (não muda depois de criada)
+        'mao_unica',
+    )
+
+    def __init__(self, origem: Cidade, destino: Cidade, comprimento: Union[int, float] = 0, nome=None,
+                 mao_unica: bool = False):
         self.origem = origem
         self.destino = destino
-        self.comprimento = comprimento
+        self.custo = comprimento
         self.nome = nome
+        self.mao_unica = mao_unica
 
         origem.conectar(self)
-        destino.conectar(self)
+        if mao_unica:
+            destino.conectar_entrada(self)
+        else:
+            destino.conectar(self)
+        # Os componentes ignoram a direção: duas cidades no mesmo componente podem não
+        # ter caminho de uma para a outra, mas em componentes diferentes nunca têm
+        origem.unir(destino).versao = next(Cidade.versoes)
+
+    @property
+    def comprimento(self):
+        return self.custo
+
+    @comprimento.setter
+    def comprimento(self, valor):
+        """Mudar o comprimento muda a versão do componente da estrada"""
+        self.custo = valor
+        self.origem.mudou()
+
+    def remover(self):
+        """Tira a estrada do mapa: as cidades deixam de conhecê-la.
+        Os componentes não são separados (o union-find não sabe desfazer uniões): até
+        recalcular_componentes, duas cidades podem parecer ligadas sem estar, mas
+        nunca o contrário."""
+        self.origem.desconectar(self)
+        self.destino.desconectar(self, self.mao_unica)
+        self.origem.mudou()
 
     def vizinho(self, cidade):
         """
@@ -163,23 +289,38 @@ class Estrada:
         Se você passar mossoró, eu retorno natal.
         """
 
-        return self.origem if self.origem.nome != cidade.nome else self.destino
+        return self.origem if self.origem.id != cidade.id else self.destino
 
     def __repr__(self):
         """Serve para poder printar a estrada, mostrando a origem, o destino, o nome (se tiver) e o comprimento"""
         nome = "" if not self.nome else " (%s)" % self.nome
-        return "%s <-> %s%s: %.0fkm" % (self.origem, self.destino, nome, self.comprimento)
+        seta = "->" if self.mao_unica else "<->"
+        return "%s %s %s%s: %.0fkm" % (self.origem, seta, self.destino, nome, self.comprimento)
+
+
+def recalcular_componentes(cidades: list):
+    """Refaz os componentes conexos das cidades a partir das estradas que elas têm hoje"""
+    for cidade in cidades:
+        cidade.pai = cidade
+        cidade.membros = 1
+        cidade.versao = next(Cidade.versoes)
+    for cidade in cidades:
+        for estrada in cidade.estradas:
+            estrada.origem.unir(estrada.destino)
 
 
 class Trilha:
     """Essa classe serve para podermos lembrar do caminho percorrido durante as buscas.
-    Um objeto Trilha sempre lembra do passo anterior, e lembra do custo acumulado até o ponto atual."""
-    # trilha
-    anterior = None
-    # cidade
-    cidade = None
-    # custo acumulado
-    custo = None
+    Um objeto Trilha sempre lembra do passo anterior, e lembra do custo acumulado até o ponto atual.
+    Trilhas que saem do mesmo ponto compartilham o começo do caminho."""
+    __slots__ = (
+        # trilha
+        'anterior',
+        # cidade
+        'cidade',
+        # custo acumulado
+        'custo',
+    )
 
     def __init__(self, cidade: Cidade, anterior: 'Trilha' = None, custo: Union[int, float] = 0):
         self.cidade = cidade
@@ -187,11 +328,14 @@ class Trilha:
         self.custo = custo
 
     def __repr__(self):
-        """Serve para podermos printar a trilha. É feito recursivamente: começamos
-        do ponto atual, e vamos printando até chegar na origem."""
-        if self.anterior:
-            return "%s -> %s" % (self.anterior, self.cidade)
-        return str(self.cidade)
+        """Serve para podermos printar a trilha. Começamos do ponto atual e voltamos
+        até a origem num laço (sem recursão, para aguentar caminhos longos)."""
+        cidades = list()
+        trilha = self
+        while trilha is not None:
+            cidades.append(str(trilha.cidade))
+            trilha = trilha.anterior
+        return " -> ".join(reversed(cidades))
 
     @property
     def real(self):
@@ -210,7 +354,7 @@ if __name__ == "__main__":
     print("Cidade:", A)
     print("Estrada:", Estrada(A, B, 10, "BR101"))
     print("Vizinhos de natal:", A.vizinhos)
-    print(A == 'natal')
-    print(A == 'mossoro')
+    print(A.nome == 'natal')
+    print(A.nome == 'mossoro')
     print(A == A)
     print(A == B)
@@ -0,0 +1,336 @@
+from buscas import *
+from grafo_compacto import GrafoCompacto
+from array import array
+import pickle
+
+
+class HierarquiaContracao:
+    """
+    Contraction Hierarchies (CH). No pré-processamento, as cidades são "contraídas"
+    uma a uma, da menos importante para a mais importante. Contrair uma cidade v é
+    tirá-la do grafo e, para cada par de vizinhos u e w cujo melhor caminho passava
+    por v, criar um atalho u -> w com o custo de u -> v -> w.
+
+    Cada cidade guarda só as estradas (originais ou atalhos) que sobem na hierarquia,
+    ou seja, que levam a cidades contraídas depois dela. A consulta é um Dijkstra
+    bidirecional que só sobe, e por isso visita pouquíssimas cidades.
+
+    As estradas que sobem ficam em arrays no formato CSR (como no GrafoCompacto):
+    as de v vão de offsets[v] a offsets[v + 1] em alvos, pesos e meios. Se meios[k]
+    for -1, a estrada é original; se não, é um atalho que passa pela cidade meios[k].
+
+    Os atalhos valem nos dois sentidos, então grafos com estradas de mão única não
+    são aceitos: para eles, use Marcos ou as buscas de buscas.py.
+    """
+    # grafo original, para traduzir índices em cidades
+    grafo = None
+    # posição de cada cidade na ordem de contração
+    nivel = None
+    # estradas que sobem, em CSR
+    offsets = None
+    alvos = None
+    pesos = None
+    meios = None
+    # quantidade de atalhos criados
+    atalhos = None
+    # máximo de cidades visitadas em cada busca por testemunha
+    limite_testemunha = None
+    # grafo de trabalho, só existe durante o pré-processamento
+    adjacencias = None
+
+    def __init__(self, grafo: GrafoCompacto, limite_testemunha: int = 50):
+        """
+        Faz o pré-processamento. limite_testemunha é a quantidade máxima de cidades
+        visitadas em cada busca por um caminho alternativo (testemunha). Buscas menores
+        deixam o pré-processamento mais rápido, mas criam mais atalhos do que o necessário.
+        """
+        if grafo.dirigido:
+            raise Exception("Contraction Hierarchies não aceita estradas de mão única")
+        self.grafo = grafo
+        self.limite_testemunha = limite_testemunha
+        n = len(grafo)
+
+        # Grafo de trabalho: adjacencias[u][w] = [peso, meio], só com o menor peso entre u e w
+        self.adjacencias = [dict() for _ in range(n)]
+        for u in range(n):
+            for peso, w in grafo.vizinhos_indices(u):
+                if u != w:
+                    self.ligar(u, w, peso, -1)
+
+        contraidos_vizinhos = [0] * n
+        ordem = count()
+        fila_prioridade = FilaPrioridade([[self.prioridade(v, 0), next(ordem), v] for v in range(n)])
+
+        self.nivel = array('i', [0] * n)
+        subidas = [None] * n
+        self.atalhos = 0
+        contraidos = 0
+
+        while fila_prioridade:
+            _, _, v = fila_prioridade.pop()
+
+            """
+            Atualização preguiçosa: a prioridade de v pode ter mudado desde que ele
+            entrou na fila. Recalculamos, e se ele não for mais o melhor, volta pra fila
+            """
+            prioridade = self.prioridade(v, contraidos_vizinhos[v])
+            if fila_prioridade and prioridade > fila_prioridade.heap[0][0]:
+                fila_prioridade.add([prioridade, next(ordem), v])
+                continue
+
+            self.nivel[v] = contraidos
+            contraidos += 1
+
+            vizinhos = self.adjacencias[v]
+            subidas[v] = [(w, peso, meio) for w, (peso, meio) in vizinhos.items()]
+            for u, w, peso in self.atalhos_necessarios(v):
+                self.ligar(u, w, peso, v)
+                self.atalhos += 1
+            for w in vizinhos:
+                del self.adjacencias[w][v]
+                contraidos_vizinhos[w] += 1
+            self.adjacencias[v] = None
+
+        del self.adjacencias
+
+        self.offsets = array('q', [0])
+        self.alvos = array('i')
+        self.pesos = array('d')
+        self.meios = array('i')
+        for subida in subidas:
+            for w, peso, meio in subida:
+                self.alvos.append(w)
+                self.pesos.append(peso)
+                self.meios.append(meio)
+            self.offsets.append(len(self.alvos))
+
+    def ligar(self, u: int, w: int, peso: float, meio: int):
+        """Liga u e w no grafo de trabalho, a menos que já exista ligação mais curta"""
+        atual = self.adjacencias[u].get(w)
+        if atual is None or peso < atual[0]:
+            self.adjacencias[u][w] = [peso, meio]
+            self.adjacencias[w][u] = [peso, meio]
+
+    def testemunhas(self, u: int, ignorar: int, limite_custo: float):
+        """
+        Dijkstra limitado a partir de u, sem passar por ignorar. Para quando o custo
+        passa de limite_custo ou quando já visitou limite_testemunha cidades.
+
+        :return: dicionário {cidade: custo} com as distâncias encontradas
+        """
+        distancias = {u: 0}
+        acomodados = set()
+        fila_prioridade = FilaPrioridade([[0, u]])
+        while fila_prioridade and len(acomodados) < self.limite_testemunha:
+            custo_atual, x = fila_prioridade.pop()
+            if x in acomodados:
+                continue
+            if custo_atual > limite_custo:
+                break
+            acomodados.add(x)
+            for y, (peso, _) in self.adjacencias[x].items():
+                if y == ignorar:
+                    continue
+                novo_custo = custo_atual + peso
+                if novo_custo < distancias.get(y, inf):
+                    distancias[y] = novo_custo
+                    fila_prioridade.add([novo_custo, y])
+        return distancias
+
+    def atalhos_necessarios(self, v: int):
+        """
+        Lista os atalhos (u, w, peso) que precisariam ser criados se v fosse contraída:
+        um para cada par de vizinhos sem caminho alternativo tão curto quanto u -> v -> w
+        """
+        vizinhos = list(self.adjacencias[v].items())
+        atalhos = list()
+        for i, (u, (peso_u, _)) in enumerate(vizinhos):
+            if i == len(vizinhos) - 1:
+                break
+            maior = peso_u + max(peso for _, (peso, _) in vizinhos[i + 1:])
+            distancias = self.testemunhas(u, v, maior)
+            for w, (peso_w, _) in vizinhos[i + 1:]:
+                if distancias.get(w, inf) > peso_u + peso_w:
+                    atalhos.append((u, w, peso_u + peso_w))
+        return atalhos
+
+    def prioridade(self, v: int, contraidos_vizinhos: int):
+        """
+        Quanto menor, mais cedo a cidade é contraída. Usamos a diferença de arestas
+        (atalhos criados - estradas removidas) mais a quantidade de vizinhos já contraídos,
+        para espalhar as contrações pelo mapa.
+        """
+        return len(self.atalhos_necessarios(v)) - len(self.adjacencias[v]) + contraidos_vizinhos
+
+    def subidas(self, v: int):
+        """Percorre as estradas que sobem a partir de v, no formato (peso, w)"""
+        for k in range(self.offsets[v], self.offsets[v + 1]):
+            yield self.pesos[k], self.alvos[k]
+
+    def desempacotar(self, u: int, w: int):
+        """
+        Transforma a estrada u -> w (que pode ser um atalho) na sequência de estradas
+        originais. Não usa recursão, para aguentar atalhos muito aninhados.
+
+        :return: lista [(cidade1, peso1), (cidade2, peso2), ...] de u (exclusive) até w
+        """
+        caminho = list()
+        pilha = [(u, w)]
+        while pilha:
+            a, b = pilha.pop()
+            # A estrada fica guardada na cidade de menor nível
+            baixo, alto = (a, b) if self.nivel[a] < self.nivel[b] else (b, a)
+            for k in range(self.offsets[baixo], self.offsets[baixo + 1]):
+                if self.alvos[k] == alto:
+                    break
+            meio = self.meios[k]
+            if meio == -1:
+                caminho.append((b, self.pesos[k]))
+            else:
+                pilha.append((meio, b))
+                pilha.append((a, meio))
+        return caminho
+
+    def consultar(self, origem: Cidade, destino: Cidade, rastreador: Rastreador = SILENCIOSO):
+        """
+        Busca o menor caminho entre origem e destino: um Dijkstra partindo de cada
+        ponta, que só segue estradas que sobem na hierarquia. O rastreador recebe os
+        índices das cidades no grafo, e não as cidades.
+
+        :return: Trilha
+        """
+        s = self.grafo.indice(origem)
+        t = self.grafo.indice(destino)
+        if not self.grafo.alcanca(s, t):
+            return None
+
+        # Índice 0 é a busca a partir da origem, índice 1 é a busca a partir do destino
+        distancias = ({s: 0}, {t: 0})
+        anteriores = ({s: None}, {t: None})
+        acomodados = (set(), set())
+        fronteiras = (FilaPrioridade([[0, s]]), FilaPrioridade([[0, t]]))
+        melhor_custo = inf
+        encontro = None
+
+        rastreador.inicio()
+        lado = 0
+        while fronteiras[0] or fronteiras[1]:
+            if not fronteiras[lado]:
+                lado = 1 - lado
+            custo_atual, v = fronteiras[lado].pop()
+            rastreador.desempilha(v)
+
+            if custo_atual >= melhor_custo:
+                # Esse lado não tem mais como melhorar o resultado
+                fronteiras[lado].heap.clear()
+                continue
+
+            if v not in acomodados[lado]:
+                acomodados[lado].add(v)
+                rastreador.visita(v)
+                outro_custo = distancias[1 - lado].get(v)
+                if outro_custo is not None and custo_atual + outro_custo < melhor_custo:
+                    melhor_custo = custo_atual + outro_custo
+                    encontro = v
+
+                for peso, w in self.subidas(v):
+                    novo_custo = custo_atual + peso
+                    if novo_custo < distancias[lado].get(w, inf):
+                        distancias[lado][w] = novo_custo
+                        anteriores[lado][w] = v
+                        fronteiras[lado].add([novo_custo, w])
+                        rastreador.relaxa(v, w, novo_custo)
+                        rastreador.empilha(w, len(fronteiras[0]) + len(fronteiras[1]))
+
+            lado = 1 - lado
+        rastreador.fim()
+
+        if encontro is None:
+            return None
+
+        # Caminho em níveis: origem -> ... -> encontro e encontro -> ... -> destino
+        subida = [encontro]
+        while anteriores[0][subida[-1]] is not None:
+            subida.append(anteriores[0][subida[-1]])
+        subida.reverse()
+        descida = [encontro]
+        while anteriores[1][descida[-1]] is not None:
+            descida.append(anteriores[1][descida[-1]])
+        pontos = subida + descida[1:]
+
+        cidade = self.grafo.cidade
+        trilha = Trilha(cidade(s))
+        for a, b in zip(pontos, pontos[1:]):
+            for v, peso in self.desempacotar(a, b):
+                trilha = Trilha(cidade(v), trilha, trilha.custo + peso)
+        return trilha
+
+    def salvar(self, caminho: str):
+        """Grava o resultado do pré-processamento, para não precisar refazer"""
+        with open(caminho, 'wb') as f:
+            pickle.dump({
+                'nivel': self.nivel,
+                'offsets': self.offsets,
+                'alvos': self.alvos,
+                'pesos': self.pesos,
+                'meios': self.meios,
+                'atalhos': self.atalhos,
+            }, f)
+
+    @classmethod
+    def carregar(cls, caminho: str, grafo: GrafoCompacto):
+        """Carrega uma hierarquia gravada com salvar. O grafo precisa ser o mesmo do pré-processamento."""
+        with open(caminho, 'rb') as f:
+            dados = pickle.load(f)
+
+        if len(dados['nivel']) != len(grafo):
+            raise Exception("A hierarquia não corresponde a este grafo")
+
+        hierarquia = cls.__new__(cls)
+        hierarquia.grafo = grafo
+        for nome, valor in dados.items():
+            setattr(hierarquia, nome, valor)
+        return hierarquia
+
+    def __repr__(self):
+        return "HierarquiaContracao(%d cidades, %d atalhos)" % (len(self.nivel), self.atalhos)
+
+
+if __name__ == "__main__":
+    """
+    Comparação entre a consulta na hierarquia, o Dijkstra e o A* em grades de tamanhos
+    diferentes. Mostra o custo do pré-processamento e o tempo médio de cada consulta.
+    """
+    from geradores import grade
+    import random
+    import time
+
+    sorteio = random.Random(0)
+    consultas = 50
+
+    print("%8s %8s %10s %10s %10s %10s" % ("cidades", "atalhos", "preproc", "CH", "dijkstra", "A*"))
+    for lado in (10, 20, 40, 60):
+        cidades = grade(lado, lado)
+        grafo = GrafoCompacto(cidades)
+
+        inicio = time.perf_counter()
+        hierarquia = HierarquiaContracao(grafo)
+        preprocessamento = time.perf_counter() - inicio
+
+        pares = [sorteio.sample(cidades, 2) for _ in range(consultas)]
+        tempos = dict()
+        for nome, buscar in (
+                ("CH", lambda a, b: hierarquia.consultar(a, b)),
+                ("dijkstra", lambda a, b: dijkstra(a, cidades, b, grafo)[b]),
+                ("A*", lambda a, b: astar(a, b, grafo))):
+            inicio = time.perf_counter()
+            custos = [buscar(a, b).custo for a, b in pares]
+            tempos[nome] = (time.perf_counter() - inicio) / consultas
+            if nome == "CH":
+                custos_ch = custos
+            elif any(abs(x - y) > 1e-9 for x, y in zip(custos, custos_ch)):
+                raise Exception("CH e %s discordam no custo" % nome)
+
+        print("%8d %8d %9.2fs %8.3fms %8.3fms %8.3fms" % (
+            len(cidades), hierarquia.atalhos, preprocessamento,
+            tempos["CH"] * 1000, tempos["dijkstra"] * 1000, tempos["A*"] * 1000))
@@ -0,0 +1,342 @@
+from buscas import *
+
+
+def estrada_existe(estrada: Estrada):
+    """Diz se a estrada ainda está no mapa (não foi removida)"""
+    return any(e is estrada for e in estrada.origem.estradas)
+
+
+class ArvoreDinamica:
+    """
+    Árvore de menores caminhos a partir de uma origem (o mesmo que o dijkstra calcula),
+    que é consertada quando uma estrada muda, em vez de ser recalculada.
+
+    Se uma estrada fica mais curta (ou é criada), só as cidades que passam a ter caminho
+    melhor por ela são revisitadas. Se fica mais longa (ou é removida) e fazia parte da
+    árvore, só a subárvore pendurada nela é desfeita e refeita a partir das cidades vizinhas
+    que não foram afetadas. Em ambos os casos o trabalho é proporcional à região afetada.
+    """
+    origem = None
+    # cidade -> custo do menor caminho a partir da origem
+    custos = None
+    # cidade -> estrada pela qual chegamos nela (None na origem)
+    anteriores = None
+    # cidade -> conjunto das cidades que chegam por ela na árvore
+    filhos = None
+    # cidades revisitadas no último conserto (para medir o trabalho)
+    tocadas = None
+
+    def __init__(self, origem: Cidade):
+        self.origem = origem
+        self.custos = {origem: 0}
+        self.anteriores = {origem: None}
+        self.filhos = {origem: set()}
+        self.tocadas = 0
+        self.propagar([[0, origem]])
+
+    def pendurar(self, cidade: Cidade, estrada: Estrada, custo):
+        """Coloca a cidade na árvore, chegando pela estrada, com o custo informado"""
+        antiga = self.anteriores.get(cidade)
+        if antiga is not None:
+            self.filhos[antiga.vizinho(cidade)].discard(cidade)
+        self.custos[cidade] = custo
+        self.anteriores[cidade] = estrada
+        self.filhos.setdefault(cidade, set())
+        if estrada is not None:
+            self.filhos[estrada.vizinho(cidade)].add(cidade)
+
+    def propagar(self, entradas: list):
+        """
+        Dijkstra a partir das entradas [custo, cidade] já colocadas na árvore,
+        que só segue por onde encontra caminhos melhores
+        """
+        ordem = count()
+        fila_prioridade = FilaPrioridade([[custo, next(ordem), cidade] for custo, cidade in entradas])
+        while fila_prioridade:
+            custo_atual, _, cidade = fila_prioridade.pop()
+            if custo_atual > self.custos.get(cidade, inf):
+                continue
+            self.tocadas += 1
+            for estrada in cidade.estradas:
+                vizinho = estrada.vizinho(cidade)
+                novo_custo = custo_atual + estrada.comprimento
+                if novo_custo < self.custos.get(vizinho, inf):
+                    self.pendurar(vizinho, estrada, novo_custo)
+                    fila_prioridade.add([novo_custo, next(ordem), vizinho])
+
+    def desfazer(self, raiz: Cidade):
+        """
+        Tira da árvore a raiz e tudo o que está pendurado nela.
+
+        :return: lista das cidades retiradas
+        """
+        antiga = self.anteriores[raiz]
+        self.filhos[antiga.vizinho(raiz)].discard(raiz)
+
+        retiradas = [raiz]
+        for cidade in retiradas:
+            retiradas.extend(self.filhos[cidade])
+        for cidade in retiradas:
+            del self.custos[cidade]
+            del self.anteriores[cidade]
+            del self.filhos[cidade]
+        return retiradas
+
+    def estrada_mudou(self, estrada: Estrada, comprimento_antigo):
+        """
+        Conserta a árvore depois que a estrada mudou de comprimento, foi criada
+        (comprimento_antigo = inf) ou foi removida do mapa.
+        """
+        self.tocadas = 0
+        existe = estrada_existe(estrada)
+        comprimento = estrada.comprimento if existe else inf
+        a, b = estrada.origem, estrada.destino
+
+        if comprimento < comprimento_antigo:
+            # Ficou mais curta: talvez uma das pontas ganhe um caminho melhor pela outra
+            entradas = list()
+            for de, para in ((a, b),) if estrada.mao_unica else ((a, b), (b, a)):
+                novo_custo = self.custos.get(de, inf) + comprimento
+                if novo_custo < self.custos.get(para, inf):
+                    self.pendurar(para, estrada, novo_custo)
+                    entradas.append([novo_custo, para])
+            self.propagar(entradas)
+
+        elif comprimento > comprimento_antigo:
+            # Ficou mais longa: só importa se alguma ponta chegava por ela
+            for ponta in (a, b):
+                if self.anteriores.get(ponta) is not estrada:
+                    continue
+
+                retiradas = self.desfazer(ponta)
+
+                """
+                Cada cidade retirada volta para a árvore pelo melhor vizinho que não foi
+                afetado (inclusive pela própria estrada, se ela ainda existir), e a partir
+                daí o Dijkstra acerta o resto
+                """
+                entradas = list()
+                for cidade in retiradas:
+                    melhor_custo = inf
+                    melhor_estrada = None
+                    for candidata in cidade.chegadas:
+                        vizinho = candidata.vizinho(cidade)
+                        custo = self.custos.get(vizinho, inf) + candidata.comprimento
+                        if custo < melhor_custo:
+                            melhor_custo = custo
+                            melhor_estrada = candidata
+                    if melhor_estrada is not None:
+                        self.pendurar(cidade, melhor_estrada, melhor_custo)
+                        entradas.append([melhor_custo, cidade])
+                self.propagar(entradas)
+
+    def trilha(self, destino: Cidade):
+        """
+        :return: Trilha da origem até o destino, ou None se não houver caminho
+        """
+        if destino not in self.anteriores:
+            return None
+        caminho = [destino]
+        while self.anteriores[caminho[-1]] is not None:
+            caminho.append(self.anteriores[caminho[-1]].vizinho(caminho[-1]))
+        return trilha_do_caminho(caminho[::-1], [self.custos[cidade] for cidade in reversed(caminho)])
+
+
+class LPAEstrela:
+    """
+    Lifelong Planning A* (LPA*): A* de ponto a ponto que reaproveita a busca anterior
+    quando estradas mudam. Cada cidade tem g (custo conhecido) e rhs (custo calculado
+    a partir dos vizinhos). Quando as duas coisas discordam, a cidade está "inconsistente"
+    e vai para a fila. Uma mudança de estrada só deixa inconsistentes as suas pontas, e o
+    conserto se espalha só até onde os custos realmente mudam.
+
+    A heurística é uma função heuristica(cidade, destino), por padrão Cidade.estimativa,
+    e precisa ser consistente para o resultado ser o menor caminho.
+
+    Os comprimentos das estradas precisam ser positivos: com estradas de comprimento 0,
+    duas cidades podem "explicar" o custo uma da outra, e g/rhs e a trilha ficam errados
+    (MapaDinamico recusa esses comprimentos).
+    """
+    origem = None
+    destino = None
+    heuristica = None
+    g = None
+    rhs = None
+    # cidade -> chave com que está na fila (cidades inconsistentes)
+    abertas = None
+    fila_prioridade = None
+    ordem = None
+    # cidades expandidas no último cálculo
+    tocadas = None
+
+    def __init__(self, origem: Cidade, destino: Cidade, heuristica=None):
+        self.origem = origem
+        self.destino = destino
+        self.heuristica = heuristica if heuristica is not None else Cidade.estimativa
+        self.g = dict()
+        self.rhs = {origem: 0}
+        self.abertas = dict()
+        self.fila_prioridade = FilaPrioridade([])
+        self.ordem = count()
+        self.tocadas = 0
+        self.enfileirar(origem)
+        self.calcular()
+
+    def chave(self, cidade: Cidade):
+        menor = min(self.g.get(cidade, inf), self.rhs.get(cidade, inf))
+        return (menor + self.heuristica(cidade, self.destino), menor)
+
+    def enfileirar(self, cidade: Cidade):
+        chave = self.chave(cidade)
+        self.abertas[cidade] = chave
+        self.fila_prioridade.add([chave, next(self.ordem), cidade])
+
+    def atualizar(self, cidade: Cidade):
+        """Recalcula o rhs da cidade e a coloca na fila se ficou inconsistente"""
+        if cidade != self.origem:
+            self.rhs[cidade] = min((self.g.get(estrada.vizinho(cidade), inf) + estrada.comprimento
+                                    for estrada in cidade.chegadas), default=inf)
+        if self.g.get(cidade, inf) != self.rhs.get(cidade, inf):
+            self.enfileirar(cidade)
+        else:
+            self.abertas.pop(cidade, None)
+
+    def topo(self):
+        """Menor chave válida da fila (entradas velhas são descartadas no caminho)"""
+        heap = self.fila_prioridade.heap
+        while heap and self.abertas.get(heap[0][2]) != heap[0][0]:
+            self.fila_prioridade.pop()
+        return heap[0][0] if heap else (inf, inf)
+
+    def calcular(self):
+        """Expande cidades inconsistentes até o custo do destino estar correto"""
+        self.tocadas = 0
+        while self.topo() < self.chave(self.destino) or \
+                self.rhs.get(self.destino, inf) != self.g.get(self.destino, inf):
+            if self.topo() == (inf, inf):
+                break
+            _, _, cidade = self.fila_prioridade.pop()
+            del self.abertas[cidade]
+            self.tocadas += 1
+
+            if self.g.get(cidade, inf) > self.rhs.get(cidade, inf):
+                self.g[cidade] = self.rhs[cidade]
+            else:
+                self.g[cidade] = inf
+                self.atualizar(cidade)
+            for estrada in cidade.estradas:
+                self.atualizar(estrada.vizinho(cidade))
+
+    def estrada_mudou(self, estrada: Estrada, comprimento_antigo):
+        """Avisa que a estrada mudou (ou foi criada, ou removida) e recalcula"""
+        self.atualizar(estrada.origem)
+        self.atualizar(estrada.destino)
+        self.calcular()
+
+    def trilha(self):
+        """
+        :return: Trilha da origem até o destino, ou None se não houver caminho
+        """
+        if self.g.get(self.destino, inf) == inf:
+            return None
+
+        # Voltamos do destino sempre pelo vizinho que explica o custo
+        caminho = [self.destino]
+        vistas = {self.destino}
+        while caminho[-1] != self.origem:
+            cidade = caminho[-1]
+            estrada = min(cidade.chegadas, key=lambda e: self.g.get(e.vizinho(cidade), inf) + e.comprimento)
+            anterior = estrada.vizinho(cidade)
+            if anterior in vistas:
+                raise Exception("Trilha passa duas vezes por %s (há estradas de comprimento não positivo?)"
+                                % anterior)
+            vistas.add(anterior)
+            caminho.append(anterior)
+        caminho.reverse()
+        return trilha_do_caminho(caminho, [self.g[cidade] for cidade in caminho])
+
+
+def conferir_comprimento(comprimento):
+    """As buscas dinâmicas só aceitam estradas de comprimento positivo (veja LPAEstrela)"""
+    if not comprimento > 0:
+        raise Exception("Comprimento precisa ser positivo: %s" % comprimento)
+
+
+class MapaDinamico:
+    """
+    Ponto de entrada para alterar o mapa com buscas "vivas": todas as árvores e
+    buscas de ponto a ponto criadas por aqui são consertadas a cada alteração.
+
+    Estradas criadas ou alteradas por aqui precisam ter comprimento positivo.
+    """
+    # árvores e buscas a consertar
+    observadores = None
+
+    def __init__(self):
+        self.observadores = list()
+
+    def arvore(self, origem: Cidade):
+        """Cria uma ArvoreDinamica a partir da origem, mantida atualizada"""
+        arvore = ArvoreDinamica(origem)
+        self.observadores.append(arvore)
+        return arvore
+
+    def ponto_a_ponto(self, origem: Cidade, destino: Cidade, heuristica=None):
+        """Cria uma busca LPAEstrela entre origem e destino, mantida atualizada"""
+        busca = LPAEstrela(origem, destino, heuristica)
+        self.observadores.append(busca)
+        return busca
+
+    def avisar(self, estrada: Estrada, comprimento_antigo):
+        for observador in self.observadores:
+            observador.estrada_mudou(estrada, comprimento_antigo)
+
+    def alterar(self, estrada: Estrada, comprimento: Union[int, float]):
+        """Muda o comprimento (custo) da estrada"""
+        conferir_comprimento(comprimento)
+        antigo = estrada.comprimento
+        estrada.comprimento = comprimento
+        self.avisar(estrada, antigo)
+
+    def adicionar(self, origem: Cidade, destino: Cidade, comprimento: Union[int, float], nome=None,
+                  mao_unica: bool = False):
+        """Cria uma estrada nova"""
+        conferir_comprimento(comprimento)
+        estrada = Estrada(origem, destino, comprimento, nome, mao_unica)
+        self.avisar(estrada, inf)
+        return estrada
+
+    def remover(self, estrada: Estrada):
+        """Tira a estrada do mapa"""
+        estrada.remover()
+        self.avisar(estrada, estrada.comprimento)
+
+
+if __name__ == "__main__":
+    from geradores import grade
+    import random
+    import time
+
+    cidades = grade(60, 60)
+    mapa = MapaDinamico()
+
+    inicio = time.perf_counter()
+    arvore = mapa.arvore(cidades[0])
+    print("Árvore inicial: %.3fs, %d cidades" % (time.perf_counter() - inicio, arvore.tocadas))
+    busca = mapa.ponto_a_ponto(cidades[0], cidades[-1])
+    print("LPA* inicial: %d cidades" % busca.tocadas)
+
+    sorteio = random.Random(0)
+    estradas = list({estrada for cidade in cidades for estrada in cidade.estradas})
+    estradas.sort(key=lambda estrada: (estrada.origem.nome, estrada.destino.nome))
+    for _ in range(5):
+        estrada = sorteio.choice(estradas)
+        inicio = time.perf_counter()
+        # Comprimentos a partir de 1, para a distância manhattan continuar consistente
+        mapa.alterar(estrada, sorteio.uniform(1, 6))
+        print("Alterada %s: %.4fs, árvore revisitou %d cidades, LPA* %d" % (
+            estrada, time.perf_counter() - inicio, arvore.tocadas, busca.tocadas))
+
+    print("Custo até %s: árvore %.1f, LPA* %.1f, dijkstra %.1f" % (
+        cidades[-1], arvore.trilha(cidades[-1]).custo, busca.trilha().custo,
+        dijkstra(cidades[0], cidades, cidades[-1])[cidades[-1]].custo))
@@ -0,0 +1,300 @@
+from classes import *
+import heapq
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class IndiceEspacial:
+    """
+    Índice das cidades pelas coordenadas, para achar a cidade mais perto de um ponto
+    qualquer (por exemplo, uma posição de GPS) sem olhar todas as cidades.
+
+    As cidades ficam em baldes de uma grade, como em geradores.geometrico. Uma consulta
+    olha o balde do ponto e vai abrindo anéis de baldes em volta, até que nenhum balde
+    mais longe possa ter uma cidade mais perto do que as já encontradas.
+    As distâncias são euclidianas, nas mesmas unidades das coordenadas.
+    """
+    # lado de cada balde
+    lado = None
+    # (bx, by) -> lista de cidades
+    baldes = None
+    # menor e maior balde ocupado, para saber quando parar de abrir anéis
+    minimo = None
+    maximo = None
+    quantidade = None
+    # Para as consultas em lote (com numpy): as cidades ordenadas por balde, numa grade densa
+    lote = None
+
+    def __init__(self, cidades: list, lado: float = None, por_balde: float = 2):
+        """
+        Se o lado não for informado, é escolhido para que cada balde tenha, em média,
+        por_balde cidades.
+        """
+        cidades = list(cidades)
+        if lado is None:
+            lado = 1
+            if cidades:
+                xs = [cidade.coordenadas[0] for cidade in cidades]
+                ys = [cidade.coordenadas[1] for cidade in cidades]
+                area = (max(xs) - min(xs)) * (max(ys) - min(ys))
+                if area > 0:
+                    lado = math.sqrt(area * por_balde / len(cidades))
+        self.lado = lado
+        self.baldes = dict()
+        self.quantidade = 0
+        for cidade in cidades:
+            self.adicionar(cidade)
+
+    def balde(self, x: float, y: float):
+        """Balde onde fica o ponto"""
+        return int(x // self.lado), int(y // self.lado)
+
+    def adicionar(self, cidade: Cidade):
+        """Coloca a cidade no índice"""
+        chave = self.balde(*cidade.coordenadas)
+        self.baldes.setdefault(chave, list()).append(cidade)
+        self.quantidade += 1
+        self.lote = None
+        if self.minimo is None:
+            self.minimo = self.maximo = chave
+        else:
+            self.minimo = (min(self.minimo[0], chave[0]), min(self.minimo[1], chave[1]))
+            self.maximo = (max(self.maximo[0], chave[0]), max(self.maximo[1], chave[1]))
+
+    def __len__(self):
+        return self.quantidade
+
+    def anel(self, bx: int, by: int, raio: int):
+        """Cidades dos baldes a exatamente raio baldes de distância (bx, by), contando na diagonal"""
+        if raio == 0:
+            yield from self.baldes.get((bx, by), ())
+            return
+        for dx in range(-raio, raio + 1):
+            yield from self.baldes.get((bx + dx, by - raio), ())
+            yield from self.baldes.get((bx + dx, by + raio), ())
+        for dy in range(-raio + 1, raio):
+            yield from self.baldes.get((bx - raio, by + dy), ())
+            yield from self.baldes.get((bx + raio, by + dy), ())
+
+    def na_caixa(self, x: float, y: float):
+        """
+        Balde de onde começar os anéis para o ponto: o balde do ponto, trazido para dentro
+        da caixa dos baldes ocupados. Um ponto longe das cidades não precisa abrir todos os
+        anéis vazios até chegar nelas.
+
+        :return: (bx, by, fora_x, fora_y), onde fora_x e fora_y são as distâncias do ponto
+                 até a caixa em cada eixo (0 se estiver dentro)
+        """
+        bx, by = self.balde(x, y)
+        bx = min(max(bx, self.minimo[0]), self.maximo[0])
+        by = min(max(by, self.minimo[1]), self.maximo[1])
+        fora_x = max(self.minimo[0] * self.lado - x, 0, x - (self.maximo[0] + 1) * self.lado)
+        fora_y = max(self.minimo[1] * self.lado - y, 0, y - (self.maximo[1] + 1) * self.lado)
+        return bx, by, fora_x, fora_y
+
+    def maior_anel(self, bx: int, by: int):
+        """A partir desse anel, não há mais baldes ocupados"""
+        return max(abs(bx - self.minimo[0]), abs(bx - self.maximo[0]),
+                   abs(by - self.minimo[1]), abs(by - self.maximo[1]))
+
+    def k_mais_proximas(self, ponto, k: int):
+        """
+        As k cidades mais perto do ponto, da mais perto para a mais longe.
+
+        :return: lista de (distancia, cidade)
+        """
+        if not self.baldes or k <= 0:
+            return []
+        x, y = ponto
+        bx, by, fora_x, fora_y = self.na_caixa(x, y)
+        # heap de máximo (distâncias negativas) com as k melhores até agora
+        melhores = list()
+        ordem = 0
+        for raio in range(self.maior_anel(bx, by) + 1):
+            for cidade in self.anel(bx, by, raio):
+                distancia = math.hypot(cidade.coordenadas[0] - x, cidade.coordenadas[1] - y)
+                ordem += 1
+                if len(melhores) < k:
+                    heapq.heappush(melhores, (-distancia, ordem, cidade))
+                elif distancia < -melhores[0][0]:
+                    heapq.heapreplace(melhores, (-distancia, ordem, cidade))
+            # Uma cidade nos próximos anéis está a mais de raio baldes do balde de partida em
+            # algum eixo; nesse eixo fica a pelo menos fora + raio * lado do ponto, e no outro a
+            # pelo menos fora (o balde de partida é o da caixa mais perto do ponto)
+            limite = min(math.hypot(fora_x + raio * self.lado, fora_y),
+                         math.hypot(fora_x, fora_y + raio * self.lado))
+            if len(melhores) == k and -melhores[0][0] <= limite:
+                break
+        return [(-distancia, cidade) for distancia, _, cidade in sorted(melhores, reverse=True)]
+
+    def mais_proxima(self, ponto):
+        """
+        A cidade mais perto do ponto (x, y).
+
+        :return: Cidade, ou None se o índice estiver vazio
+        """
+        encontradas = self.k_mais_proximas(ponto, 1)
+        return encontradas[0][1] if encontradas else None
+
+    def no_raio(self, ponto, raio: float):
+        """
+        Cidades a no máximo raio de distância do ponto, da mais perto para a mais longe.
+
+        :return: lista de (distancia, cidade)
+        """
+        x, y = ponto
+        x0, y0 = self.balde(x - raio, y - raio)
+        x1, y1 = self.balde(x + raio, y + raio)
+        encontradas = list()
+        for bx in range(max(x0, self.minimo[0]), min(x1, self.maximo[0]) + 1) if self.baldes else ():
+            for by in range(max(y0, self.minimo[1]), min(y1, self.maximo[1]) + 1):
+                for cidade in self.baldes.get((bx, by), ()):
+                    distancia = math.hypot(cidade.coordenadas[0] - x, cidade.coordenadas[1] - y)
+                    if distancia <= raio:
+                        encontradas.append((distancia, cidade))
+        encontradas.sort(key=lambda encontrada: encontrada[0])
+        return encontradas
+
+    def preparar_lote(self):
+        """
+        Monta a grade densa usada por mais_proximas: as coordenadas das cidades em
+        vetores ordenados por balde, e onde cada balde começa nesses vetores.
+        Se a grade densa for muito maior do que a quantidade de cidades (cidades muito
+        espalhadas), não vale a pena, e as consultas em lote são feitas uma a uma.
+
+        :return: dicionário com os vetores, ou None
+        """
+        largura = self.maximo[0] - self.minimo[0] + 1
+        altura = self.maximo[1] - self.minimo[1] + 1
+        if largura * altura > 4 * self.quantidade + 1024:
+            return None
+
+        cidades = list()
+        posicoes = list()
+        for (bx, by), balde in self.baldes.items():
+            posicao = (bx - self.minimo[0]) * altura + (by - self.minimo[1])
+            cidades.extend(balde)
+            posicoes.extend([posicao] * len(balde))
+        posicoes = numpy.asarray(posicoes, dtype=numpy.int64)
+        ordem = numpy.argsort(posicoes, kind='stable')
+        coordenadas = numpy.array([cidade.coordenadas for cidade in cidades], dtype=numpy.float64)[ordem]
+        inicios = numpy.zeros(largura * altura + 1, dtype=numpy.int64)
+        inicios[1:] = numpy.cumsum(numpy.bincount(posicoes, minlength=largura * altura))
+        return {
+            'cidades': [cidades[i] for i in ordem.tolist()],
+            'xs': coordenadas[:, 0].copy(),
+            'ys': coordenadas[:, 1].copy(),
+            'inicios': inicios,
+            'largura': largura,
+            'altura': altura,
+        }
+
+    def mais_proximas(self, pontos):
+        """
+        A cidade mais perto de cada ponto, para muitos pontos de uma vez.
+
+        Faz a mesma busca por anéis de mais_proxima, mas para todos os pontos ao mesmo
+        tempo: para cada balde do anel (em relação ao balde de cada ponto) e para cada
+        posição dentro do balde, as distâncias de todos os pontos ainda em aberto saem
+        numa só operação numpy. Um ponto sai da busca quando nenhum anel mais longe
+        pode ter uma cidade mais perto do que a que ele já achou.
+
+        :return: lista de cidades, na ordem dos pontos (None se o índice estiver vazio)
+        """
+        pontos = list(pontos)
+        if not self.baldes:
+            return [None] * len(pontos)
+        if numpy is not None and self.lote is None:
+            self.lote = self.preparar_lote() or False
+        if numpy is None or not self.lote or not pontos:
+            return [self.mais_proxima(ponto) for ponto in pontos]
+
+        lote = self.lote
+        xs, ys, inicios = lote['xs'], lote['ys'], lote['inicios']
+        largura, altura = lote['largura'], lote['altura']
+
+        coordenadas = numpy.asarray(pontos, dtype=numpy.float64)
+        px, py = coordenadas[:, 0], coordenadas[:, 1]
+        # Como em na_caixa: os anéis começam no balde do ponto trazido para dentro da caixa
+        bx = numpy.clip(numpy.floor(px / self.lado).astype(numpy.int64) - self.minimo[0], 0, largura - 1)
+        by = numpy.clip(numpy.floor(py / self.lado).astype(numpy.int64) - self.minimo[1], 0, altura - 1)
+        fora_x = numpy.maximum(numpy.maximum(self.minimo[0] * self.lado - px, 0),
+                               px - (self.maximo[0] + 1) * self.lado)
+        fora_y = numpy.maximum(numpy.maximum(self.minimo[1] * self.lado - py, 0),
+                               py - (self.maximo[1] + 1) * self.lado)
+        # Anel a partir do qual não há mais baldes ocupados, para cada ponto
+        ultimo = numpy.maximum(numpy.maximum(numpy.abs(bx), numpy.abs(bx - largura + 1)),
+                               numpy.maximum(numpy.abs(by), numpy.abs(by - altura + 1)))
+
+        melhores = numpy.full(len(pontos), -1, dtype=numpy.int64)
+        distancias = numpy.full(len(pontos), numpy.inf)
+        abertos = numpy.arange(len(pontos))
+        raio = 0
+        while len(abertos):
+            if raio == 0:
+                deslocamentos = [(0, 0)]
+            else:
+                deslocamentos = ([(dx, dy) for dx in range(-raio, raio + 1) for dy in (-raio, raio)]
+                                 + [(dx, dy) for dx in (-raio, raio) for dy in range(-raio + 1, raio)])
+            for dx, dy in deslocamentos:
+                cx, cy = bx[abertos] + dx, by[abertos] + dy
+                dentro = (cx >= 0) & (cx < largura) & (cy >= 0) & (cy < altura)
+                quais = abertos[dentro]
+                posicao = cx[dentro] * altura + cy[dentro]
+                inicio = inicios[posicao]
+                quantos = inicios[posicao + 1] - inicio
+                for j in range(int(quantos.max()) if len(quantos) else 0):
+                    tem = quantos > j
+                    i, cidade = quais[tem], inicio[tem] + j
+                    d = (xs[cidade] - px[i]) ** 2 + (ys[cidade] - py[i]) ** 2
+                    melhorou = d < distancias[i]
+                    distancias[i[melhorou]] = d[melhorou]
+                    melhores[i[melhorou]] = cidade[melhorou]
+            # O mesmo limite de k_mais_proximas, ao quadrado
+            fx, fy = fora_x[abertos], fora_y[abertos]
+            limite = numpy.minimum((fx + raio * self.lado) ** 2 + fy ** 2, fx ** 2 + (fy + raio * self.lado) ** 2)
+            terminados = (distancias[abertos] <= limite) | (ultimo[abertos] <= raio)
+            abertos = abertos[~terminados]
+            raio += 1
+
+        cidades = lote['cidades']
+        return [cidades[i] for i in melhores.tolist()]
+
+    def __repr__(self):
+        return "IndiceEspacial(%d cidades, %d baldes, lado %.3g)" % (self.quantidade, len(self.baldes), self.lado)
+
+
+if __name__ == "__main__":
+    from geradores import geometrico
+    import random
+    import time
+
+    cidades = geometrico(100000)
+    inicio = time.perf_counter()
+    indice = IndiceEspacial(cidades)
+    print(indice, "montado em %.2fs" % (time.perf_counter() - inicio))
+
+    sorteio = random.Random(0)
+    lado = math.sqrt(len(cidades))
+    pontos = [(sorteio.uniform(0, lado), sorteio.uniform(0, lado)) for _ in range(100000)]
+
+    inicio = time.perf_counter()
+    uma_a_uma = [indice.mais_proxima(ponto) for ponto in pontos]
+    print("mais_proxima:  %.1fus por ponto" % ((time.perf_counter() - inicio) * 1e6 / len(pontos)))
+
+    inicio = time.perf_counter()
+    em_lote = indice.mais_proximas(pontos)
+    print("mais_proximas: %.1fus por ponto" % ((time.perf_counter() - inicio) * 1e6 / len(pontos)))
+
+    inicio = time.perf_counter()
+    for ponto in pontos[:100]:
+        min(cidades, key=lambda cidade: math.dist(cidade.coordenadas, ponto))
+    print("varredura:     %.1fus por ponto" % ((time.perf_counter() - inicio) * 1e6 / 100))
+
+    print("Mesmas respostas:", all(a is b for a, b in zip(uma_a_uma, em_lote)))
+    print("5 mais próximas de (10, 10):", indice.k_mais_proximas((10, 10), 5))
+    print("Num raio de 1 de (10, 10):", [cidade for _, cidade in indice.no_raio((10, 10), 1)])
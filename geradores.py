@@ -0,0 +1,107 @@
+from classes import *
+import math
+import random
+
+
+def grade(largura: int, altura: int, semente: int = 0, implementacao: str = MANHATTAN):
+    """
+    Gera um mapa em grade: cada cidade fica numa coordenada inteira (x, y) e se liga
+    às vizinhas da direita e de cima. O comprimento de cada estrada é sorteado entre
+    1 e 3, então a distância manhattan nunca passa do custo real.
+
+    :return: lista de cidades, na ordem (0, 0), (1, 0), ..., (largura - 1, altura - 1)
+    """
+    sorteio = random.Random(semente)
+    cidades = [Cidade("%d_%d" % (x, y), (x, y), implementacao) for y in range(altura) for x in range(largura)]
+
+    for y in range(altura):
+        for x in range(largura):
+            cidade = cidades[y * largura + x]
+            if x + 1 < largura:
+                Estrada(cidade, cidades[y * largura + x + 1], sorteio.uniform(1, 3))
+            if y + 1 < altura:
+                Estrada(cidade, cidades[(y + 1) * largura + x], sorteio.uniform(1, 3))
+
+    return cidades
+
+
+def geometrico(n: int, grau: float = 6, semente: int = 0, implementacao: str = MANHATTAN):
+    """
+    Gera um grafo geométrico aleatório: n cidades espalhadas num quadrado de lado
+    raiz(n), ligadas quando estão a menos de um raio que dá, em média, grau vizinhos.
+    O comprimento de cada estrada é a distância manhattan vezes um fator entre 1 e 1.3,
+    para a estimativa manhattan continuar válida.
+
+    As cidades são separadas em baldes de lado igual ao raio, então só comparamos
+    cada cidade com as dos baldes vizinhos.
+
+    :return: lista de cidades
+    """
+    sorteio = random.Random(semente)
+    lado = math.sqrt(n)
+    raio = math.sqrt(grau / math.pi)
+    cidades = [Cidade(str(i), (sorteio.uniform(0, lado), sorteio.uniform(0, lado)), implementacao) for i in range(n)]
+
+    baldes = dict()
+    for cidade in cidades:
+        chave = (int(cidade.coordenadas[0] // raio), int(cidade.coordenadas[1] // raio))
+        baldes.setdefault(chave, list()).append(cidade)
+
+    for (bx, by), balde in baldes.items():
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                # Cada par de baldes é visitado uma vez só
+                if (dx, dy) < (0, 0):
+                    continue
+                outro = baldes.get((bx + dx, by + dy))
+                if outro is None:
+                    continue
+                for i, a in enumerate(balde):
+                    for b in (balde[i + 1:] if outro is balde else outro):
+                        if math.dist(a.coordenadas, b.coordenadas) < raio:
+                            Estrada(a, b, a.distancia_estimada(b) * sorteio.uniform(1, 1.3))
+
+    return cidades
+
+
+def livre_de_escala(n: int, m: int = 2, semente: int = 0, implementacao: str = MANHATTAN):
+    """
+    Gera um grafo livre de escala (modelo de Barabási-Albert): cada cidade nova se liga
+    a m cidades já existentes, escolhidas com probabilidade proporcional à quantidade
+    de estradas que elas já têm. Poucas cidades acabam com muitas estradas.
+
+    As cidades não têm coordenadas (ficam todas em (0, 0)), então a estimativa manhattan
+    é sempre 0. O comprimento das estradas é sorteado entre 1 e 10.
+
+    :return: lista de cidades
+    """
+    sorteio = random.Random(semente)
+    cidades = [Cidade(str(i), implementacao=implementacao) for i in range(n)]
+
+    # Cada cidade aparece aqui uma vez para cada estrada que tem
+    pontas = list()
+    for i in range(1, min(m + 1, n)):
+        Estrada(cidades[i], cidades[0], sorteio.uniform(1, 10))
+        pontas.extend((i, 0))
+
+    for i in range(m + 1, n):
+        escolhidas = set()
+        while len(escolhidas) < m:
+            escolhidas.add(sorteio.choice(pontas))
+        for j in escolhidas:
+            Estrada(cidades[i], cidades[j], sorteio.uniform(1, 10))
+            pontas.extend((i, j))
+
+    return cidades
+
+
+if __name__ == "__main__":
+    cidades = grade(3, 2)
+    print("Cidades:", cidades)
+    print("Estradas de 0_0:", cidades[0].estradas)
+
+    cidades = geometrico(10)
+    print("Geométrico:", sum(len(c.estradas) for c in cidades) // 2, "estradas")
+
+    cidades = livre_de_escala(10)
+    print("Livre de escala:", sum(len(c.estradas) for c in cidades) // 2, "estradas")
@@ -0,0 +1,410 @@
+from classes import *
+from array import array
+from math import inf
+import mmap
+import struct
+
+"""
+Formato binário do GrafoCompacto. O arquivo começa com um cabeçalho
+(assinatura, versão, marca de ordem dos bytes, quantidade de cidades n, de arcos m
+e de arcos reversos r) e depois vem cada seção, alinhada em 8 bytes:
+offsets (n + 1 int64), alvos (m int32), pesos (m float64), xs, ys e estimativas
+(n float64 cada), offsets dos nomes (n + 1 int64) e os nomes em utf-8, colados.
+Se o grafo tem estradas de mão única, r = m e vêm ainda os arrays reversos:
+offsets (n + 1 int64), alvos (r int32) e pesos (r float64). Se não, r = 0.
+
+A versão 1 não tinha r nem os arrays reversos, e continua podendo ser carregada.
+"""
+ASSINATURA = b'GRAFOCSR'
+VERSAO = 2
+MARCA = 0x01020304
+CABECALHO = struct.Struct('=8sIIqqq')
+CABECALHO_V1 = struct.Struct('=8sIIqq')
+
+
+def alinhar(tamanho: int):
+    """Arredonda o tamanho para o próximo múltiplo de 8"""
+    return (tamanho + 7) & ~7
+
+
+class CidadesMapeadas:
+    """
+    Lista de cidades de um GrafoCompacto carregado de arquivo. As cidades só são
+    criadas quando alguém pede por elas, então carregar o arquivo não custa nada
+    proporcional ao tamanho do grafo.
+    """
+    grafo = None
+    implementacao = None
+    # índice -> cidade já criada
+    criadas = None
+
+    def __init__(self, grafo: 'GrafoCompacto', implementacao: str):
+        self.grafo = grafo
+        self.implementacao = implementacao
+        self.criadas = dict()
+
+    def __len__(self):
+        return len(self.grafo.offsets) - 1
+
+    def __getitem__(self, i: int):
+        cidade = self.criadas.get(i)
+        if cidade is None:
+            grafo = self.grafo
+            cidade = Cidade(grafo.nome(i), (grafo.xs[i], grafo.ys[i]), self.implementacao)
+            cidade.estimativa_fornecida = grafo.estimativas[i]
+            self.criadas[i] = cidade
+            grafo.indices[cidade] = i
+        return cidade
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class GrafoCompacto:
+    """
+    Representação congelada do grafo em arrays (formato CSR, compressed sparse row).
+    Cada cidade recebe um índice inteiro, e as estradas que saem da cidade i ficam
+    guardadas nas posições offsets[i] até offsets[i + 1] dos arrays alvos e pesos.
+
+    Por exemplo, se natal (0) se liga a mossoro (1) com 280km e a caico (2) com 250km:
+    offsets = [0, 2, 3, 4]
+    alvos   = [1, 2, 0, 0]
+    pesos   = [280, 250, 280, 250]
+
+    Uma estrada de mão dupla aparece uma vez em cada ponta; uma de mão única, só na origem.
+
+    Para as buscas de trás pra frente, há também os arrays reversos, no mesmo formato:
+    as posições offsets_reversos[i] até offsets_reversos[i + 1] dizem de onde se chega
+    na cidade i. Sem estradas de mão única eles são os mesmos arrays de ida (não há
+    cópia); com elas, cada arco aparece uma vez em cada direção de leitura.
+    Depois de montado, o grafo não muda: para alterar estradas, monte outro.
+    """
+    # cidades, na ordem dos índices
+    cidades = None
+    # cidade -> índice
+    indices = None
+    # início das estradas de cada cidade em alvos/pesos (tamanho n + 1)
+    offsets = None
+    # índice da cidade vizinha em cada estrada
+    alvos = None
+    # comprimento de cada estrada
+    pesos = None
+    # o mesmo, com os arcos ao contrário (de onde se chega em cada cidade)
+    offsets_reversos = None
+    alvos_reversos = None
+    pesos_reversos = None
+    # se há estradas de mão única (se não, os arrays reversos são os de ida)
+    dirigido = False
+    # coordenadas e estimativas fornecidas, por índice
+    xs = None
+    ys = None
+    estimativas = None
+    # nome -> índice, montado na primeira consulta por nome
+    por_nome = None
+    # índice -> número do componente conexo, montado na primeira consulta de alcanca
+    componentes = None
+    # buffers dos nomes (só quando carregado de arquivo)
+    nomes_offsets = None
+    nomes_bytes = None
+    # arquivo mapeado em memória (só quando carregado de arquivo)
+    mapa = None
+
+    def __init__(self, cidades: list, estradas: list = None):
+        """
+        Monta o grafo a partir de uma lista de cidades. Se a lista de estradas for
+        passada, só elas são consideradas; se não, usamos as estradas de cada cidade.
+        """
+        self.cidades = list(cidades)
+        self.indices = {cidade: i for i, cidade in enumerate(self.cidades)}
+
+        if estradas is None:
+            adjacencias = [[(estrada.vizinho(cidade), estrada.comprimento) for estrada in cidade.estradas]
+                           for cidade in self.cidades]
+            self.dirigido = any(cidade.entradas for cidade in self.cidades)
+            if self.dirigido:
+                reversas = [[(estrada.vizinho(cidade), estrada.comprimento) for estrada in cidade.chegadas]
+                            for cidade in self.cidades]
+        else:
+            adjacencias = [[] for _ in self.cidades]
+            reversas = [[] for _ in self.cidades]
+            for estrada in estradas:
+                origem, destino = self.indices[estrada.origem], self.indices[estrada.destino]
+                adjacencias[origem].append((estrada.destino, estrada.comprimento))
+                reversas[destino].append((estrada.origem, estrada.comprimento))
+                if estrada.mao_unica:
+                    self.dirigido = True
+                else:
+                    adjacencias[destino].append((estrada.origem, estrada.comprimento))
+                    reversas[origem].append((estrada.destino, estrada.comprimento))
+
+        self.offsets, self.alvos, self.pesos = self.montar_arrays(adjacencias)
+        if self.dirigido:
+            self.offsets_reversos, self.alvos_reversos, self.pesos_reversos = self.montar_arrays(reversas)
+        else:
+            self.offsets_reversos, self.alvos_reversos, self.pesos_reversos = self.offsets, self.alvos, self.pesos
+
+        self.xs = array('d', [cidade.coordenadas[0] for cidade in self.cidades])
+        self.ys = array('d', [cidade.coordenadas[1] for cidade in self.cidades])
+        self.estimativas = array('d', [cidade.estimativa_fornecida for cidade in self.cidades])
+
+    def montar_arrays(self, adjacencias: list):
+        """Arrays CSR (offsets, alvos, pesos) a partir das listas de (vizinho, comprimento) de cada cidade"""
+        offsets = array('q', [0])
+        alvos = array('i')
+        pesos = array('d')
+        for adjacencia in adjacencias:
+            for vizinho, comprimento in adjacencia:
+                alvos.append(self.indices[vizinho])
+                pesos.append(comprimento)
+            offsets.append(len(alvos))
+        return offsets, alvos, pesos
+
+    @classmethod
+    def de_leitor(cls, leitor):
+        """Monta o grafo a partir de um LeitorInput já carregado"""
+        return cls(leitor.cidades, leitor.estradas)
+
+    def __len__(self):
+        """Quantidade de cidades"""
+        return len(self.cidades)
+
+    @property
+    def arcos(self):
+        """Quantidade de estradas, contando cada sentido separadamente"""
+        return len(self.alvos)
+
+    def indice(self, cidade: Union[Cidade, str]):
+        """Retorna o índice da cidade (ou do nome da cidade)"""
+        if isinstance(cidade, str):
+            if self.por_nome is None:
+                self.por_nome = {self.nome(i): i for i in range(len(self))}
+            if cidade not in self.por_nome:
+                raise Exception("Cidade não encontrada: %s" % cidade)
+            return self.por_nome[cidade]
+        return self.indices[cidade]
+
+    def nome(self, i: int):
+        """Retorna o nome da cidade de índice i, sem precisar criar a cidade"""
+        if self.nomes_bytes is None:
+            return self.cidades[i].nome
+        return bytes(self.nomes_bytes[self.nomes_offsets[i]:self.nomes_offsets[i + 1]]).decode('utf-8')
+
+    def cidade(self, i: int):
+        """Retorna a cidade de índice i"""
+        return self.cidades[i]
+
+    def rotular_componentes(self):
+        """
+        Rotula cada cidade com o número do seu componente conexo (uma busca em
+        largura por componente). O grafo não muda, então isso é feito uma vez só.
+        As estradas de mão única são seguidas nos dois sentidos, como em Estrada.
+        """
+        componentes = array('i', [-1]) * len(self)
+        rotulo = 0
+        for inicio in range(len(self)):
+            if componentes[inicio] != -1:
+                continue
+            componentes[inicio] = rotulo
+            pendentes = [inicio]
+            while pendentes:
+                i = pendentes.pop()
+                vizinhos = self.alvos[self.offsets[i]:self.offsets[i + 1]]
+                if self.dirigido:
+                    vizinhos = list(vizinhos) + list(self.alvos_reversos[self.offsets_reversos[i]:
+                                                                         self.offsets_reversos[i + 1]])
+                for j in vizinhos:
+                    if componentes[j] == -1:
+                        componentes[j] = rotulo
+                        pendentes.append(j)
+            rotulo += 1
+        self.componentes = componentes
+
+    def alcanca(self, i: int, j: int):
+        """
+        Diz se existe caminho entre as cidades de índices i e j. Com estradas de mão
+        única, pode ser que o caminho só exista de j para i (veja buscas.reachable).
+        """
+        if self.componentes is None:
+            self.rotular_componentes()
+        return self.componentes[i] == self.componentes[j]
+
+    def arrays(self, reverso: bool = False):
+        """(offsets, alvos, pesos) de ida, ou os reversos"""
+        if reverso:
+            return self.offsets_reversos, self.alvos_reversos, self.pesos_reversos
+        return self.offsets, self.alvos, self.pesos
+
+    def vizinhos_indices(self, i: int, reverso: bool = False):
+        """
+        Percorre os vizinhos da cidade de índice i, no formato
+        (custo0, indice0), (custo1, indice1), ...
+        Nada é alocado além da própria tupla: lemos direto dos arrays.
+        Se reverso, percorre as cidades de onde se chega em i.
+        """
+        offsets, alvos, pesos = self.arrays(reverso)
+        for k in range(offsets[i], offsets[i + 1]):
+            yield pesos[k], alvos[k]
+
+    def vizinhos_com_custo(self, cidade: Cidade, reverso: bool = False):
+        """
+        Mesmo formato de Cidade.vizinhos_com_custo (ou de Cidade.antecessores_com_custo,
+        se reverso), mas lendo dos arrays: (custo0, vizinho0), (custo1, vizinho1), ...
+        """
+        cidades = self.cidades
+        for custo, j in self.vizinhos_indices(self.indices[cidade], reverso):
+            yield custo, cidades[j]
+
+    def arvore(self, origem: int, alvos=None, reverso: bool = False):
+        """
+        Dijkstra direto sobre os índices, a partir da cidade de índice origem.
+        Não cria cidades nem trilhas: serve para os pré-processamentos e consultas em
+        lote que só precisam das distâncias. Se alvos (índices) for informado, a busca
+        para assim que todos eles forem acomodados.
+
+        Se reverso, segue as estradas ao contrário: as distâncias são de cada cidade
+        até a origem, e anteriores[v] é a próxima cidade no caminho de v até a origem.
+
+        :return: (distancias, anteriores), arrays com a distância até cada cidade
+        (inf se não houver caminho) e o índice da cidade anterior no caminho (-1 se não houver)
+        """
+        offsets, alvos_arcos, pesos = self.arrays(reverso)
+        distancias = array('d', [inf]) * len(self)
+        anteriores = array('i', [-1]) * len(self)
+        distancias[origem] = 0
+        fila_prioridade = FilaPrioridade([[0, origem]])
+
+        faltando = None
+        if alvos is not None:
+            faltando = set(alvos)
+
+        while fila_prioridade:
+            custo_atual, v = fila_prioridade.pop()
+            if custo_atual > distancias[v]:
+                continue
+            if faltando is not None:
+                faltando.discard(v)
+                if not faltando:
+                    break
+            for k in range(offsets[v], offsets[v + 1]):
+                novo_custo = custo_atual + pesos[k]
+                w = alvos_arcos[k]
+                if novo_custo < distancias[w]:
+                    distancias[w] = novo_custo
+                    anteriores[w] = v
+                    fila_prioridade.add([novo_custo, w])
+
+        return distancias, anteriores
+
+    def distancias(self, origem: int, alvos=None, reverso: bool = False):
+        """
+        Mesmo que arvore, mas retorna só o array de distâncias
+        """
+        return self.arvore(origem, alvos, reverso)[0]
+
+    def salvar(self, caminho: str):
+        """Grava o grafo no formato binário, para ser carregado depois com GrafoCompacto.carregar"""
+        nomes = [self.nome(i).encode('utf-8') for i in range(len(self))]
+        nomes_offsets = array('q', [0])
+        for nome in nomes:
+            nomes_offsets.append(nomes_offsets[-1] + len(nome))
+
+        secoes = [self.offsets, self.alvos, self.pesos, self.xs, self.ys, self.estimativas,
+                  nomes_offsets, b''.join(nomes)]
+        reversos = 0
+        if self.dirigido:
+            secoes += [self.offsets_reversos, self.alvos_reversos, self.pesos_reversos]
+            reversos = len(self.alvos_reversos)
+
+        with open(caminho, 'wb') as f:
+            f.write(CABECALHO.pack(ASSINATURA, VERSAO, MARCA, len(self), self.arcos, reversos))
+            for secao in secoes:
+                dados = bytes(secao)
+                f.write(dados)
+                f.write(bytes(alinhar(len(dados)) - len(dados)))
+
+    @classmethod
+    def carregar(cls, caminho: str, implementacao: str = ARQUIVO):
+        """
+        Carrega um grafo gravado com salvar. O arquivo é mapeado em memória (mmap)
+        e os arrays do grafo passam a ser visões diretas sobre o mapeamento: nada é
+        copiado, e vários processos que abrirem o mesmo arquivo compartilham as páginas.
+        """
+        with open(caminho, 'rb') as f:
+            mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        assinatura, versao, marca, n, m = CABECALHO_V1.unpack_from(mapa)
+        if assinatura != ASSINATURA or versao not in (1, VERSAO):
+            raise Exception("Arquivo de grafo inválido: %s" % caminho)
+        if marca != MARCA:
+            raise Exception("Arquivo de grafo gravado com outra ordem de bytes: %s" % caminho)
+
+        reversos = 0
+        posicao = CABECALHO_V1.size
+        if versao == VERSAO:
+            reversos = CABECALHO.unpack_from(mapa)[-1]
+            posicao = CABECALHO.size
+        buffer = memoryview(mapa)
+
+        def secao(formato: str, quantidade: int):
+            nonlocal posicao
+            tamanho = struct.calcsize(formato) * quantidade
+            visao = buffer[posicao:posicao + tamanho].cast(formato)
+            posicao += alinhar(tamanho)
+            return visao
+
+        grafo = cls.__new__(cls)
+        grafo.mapa = mapa
+        grafo.offsets = secao('q', n + 1)
+        grafo.alvos = secao('i', m)
+        grafo.pesos = secao('d', m)
+        grafo.xs = secao('d', n)
+        grafo.ys = secao('d', n)
+        grafo.estimativas = secao('d', n)
+        grafo.nomes_offsets = secao('q', n + 1)
+        grafo.nomes_bytes = secao('B', grafo.nomes_offsets[n])
+        if reversos:
+            grafo.dirigido = True
+            grafo.offsets_reversos = secao('q', n + 1)
+            grafo.alvos_reversos = secao('i', reversos)
+            grafo.pesos_reversos = secao('d', reversos)
+        else:
+            grafo.offsets_reversos, grafo.alvos_reversos, grafo.pesos_reversos = grafo.offsets, grafo.alvos, grafo.pesos
+        grafo.indices = dict()
+        grafo.cidades = CidadesMapeadas(grafo, implementacao)
+        return grafo
+
+    def __repr__(self):
+        return "GrafoCompacto(%d cidades, %d arcos)" % (len(self), self.arcos)
+
+
+if __name__ == "__main__":
+    import sys
+
+    """
+    Uso: python grafo_compacto.py grafo.txt grafo.bin
+    Lê o arquivo texto e exporta o grafo no formato binário.
+    """
+    if len(sys.argv) == 3:
+        from main import LeitorInput
+
+        grafo = GrafoCompacto.de_leitor(LeitorInput(sys.argv[1]))
+        grafo.salvar(sys.argv[2])
+        print("%s exportado para %s" % (grafo, sys.argv[2]))
+        sys.exit()
+
+    A = Cidade('natal', (0, 0))
+    B = Cidade('mossoro', (0, 10))
+    C = Cidade('caico', (5, 5))
+    Estrada(A, B, 280, "BR304")
+    Estrada(A, C, 250)
+    Estrada(C, B, 120, mao_unica=True)
+
+    grafo = GrafoCompacto([A, B, C])
+    print(grafo)
+    print("offsets:", list(grafo.offsets))
+    print("alvos:", list(grafo.alvos))
+    print("pesos:", list(grafo.pesos))
+    print("Vizinhos de natal:", list(grafo.vizinhos_com_custo(A)))
+    print("De onde se chega em mossoro:", list(grafo.vizinhos_com_custo(B, reverso=True)))
+    print("Distâncias até mossoro:", list(grafo.distancias(1, reverso=True)))
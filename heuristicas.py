@@ -0,0 +1,276 @@
+from classes import *
+from array import array
+from collections import OrderedDict
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+"""
+Métricas de distância entre coordenadas. Com HAVERSINE, as coordenadas de cada
+cidade são (latitude, longitude) em graus, e a distância sai em quilômetros.
+"""
+EUCLIDIANA = 'euclidiana'
+HAVERSINE = 'haversine'
+# MANHATTAN vem de classes.py
+METRICAS = (MANHATTAN, EUCLIDIANA, HAVERSINE)
+
+# Raio médio da Terra, em quilômetros
+RAIO_TERRA = 6371.0
+
+
+def distancias_numpy(xs, ys, x: float, y: float, metrica: str, raio: float):
+    """Distância de cada ponto (xs[i], ys[i]) até (x, y), numa única operação vetorizada"""
+    if metrica == MANHATTAN:
+        return numpy.abs(xs - x) + numpy.abs(ys - y)
+    if metrica == EUCLIDIANA:
+        return numpy.hypot(xs - x, ys - y)
+    latitudes, longitudes = numpy.radians(xs), numpy.radians(ys)
+    lat, lon = math.radians(x), math.radians(y)
+    a = (numpy.sin((latitudes - lat) / 2) ** 2
+         + numpy.cos(latitudes) * math.cos(lat) * numpy.sin((longitudes - lon) / 2) ** 2)
+    return 2 * raio * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1)))
+
+
+def distancias_python(xs, ys, x: float, y: float, metrica: str, raio: float):
+    """Mesmo que distancias_numpy, para quando numpy não está instalado"""
+    if metrica == MANHATTAN:
+        return [abs(a - x) + abs(b - y) for a, b in zip(xs, ys)]
+    if metrica == EUCLIDIANA:
+        return [math.hypot(a - x, b - y) for a, b in zip(xs, ys)]
+    lat, lon = math.radians(x), math.radians(y)
+    cos_lat = math.cos(lat)
+    resultado = list()
+    for a, b in zip(xs, ys):
+        a, b = math.radians(a), math.radians(b)
+        h = math.sin((a - lat) / 2) ** 2 + math.cos(a) * cos_lat * math.sin((b - lon) / 2) ** 2
+        resultado.append(2 * raio * math.asin(math.sqrt(min(h, 1))))
+    return resultado
+
+
+class HeuristicaVetorizada:
+    """
+    Heurística calculada a partir das coordenadas de todas as cidades, guardadas num
+    vetor numpy. Em vez de uma chamada Python por estrada, a distância de todas as
+    cidades até o destino sai de uma só operação vetorizada, e a busca só consulta
+    a tabela.
+
+    Pode ser passada como heuristica para qualquer busca de buscas.py:
+    astar(origem, destino, heuristica=HeuristicaVetorizada(cidades))
+
+    astar e greedy_best_first reconhecem o método para_destino e consultam a tabela
+    direto, sem passar por __call__.
+    """
+    # cidades, na ordem das linhas do vetor
+    cidades = None
+    # cidade -> linha
+    indices = None
+    # Se os ids das cidades são quase contíguos, as tabelas são indexadas por
+    # cidade.id - base, e a consulta não precisa passar pelo dicionário de índices
+    base = None
+    # linha -> posição na tabela (cidade.id - base)
+    posicoes = None
+    tamanho_tabela = None
+    # coordenadas (numpy.ndarray, ou listas se numpy não estiver instalado)
+    xs = None
+    ys = None
+    metrica = None
+    # só para HAVERSINE: raio da esfera, na unidade do custo das estradas
+    raio = None
+    # multiplica as distâncias (por exemplo, para converter de quilômetros para minutos)
+    fator = None
+    # destino -> lista de estimativas, para os últimos destinos usados
+    tabelas = None
+    tamanho_cache = None
+
+    def __init__(self, cidades: list, metrica: str = MANHATTAN, fator: float = 1, raio: float = RAIO_TERRA,
+                 tamanho_cache: int = 4, coordenadas=None):
+        if metrica not in METRICAS:
+            raise Exception("Métrica desconhecida: %s" % metrica)
+        self.cidades = cidades
+        self.indices = {cidade: i for i, cidade in enumerate(cidades)}
+        self.metrica = metrica
+        self.fator = fator
+        self.raio = raio
+        self.tamanho_cache = tamanho_cache
+        self.tabelas = OrderedDict()
+
+        if coordenadas is None:
+            xs = [cidade.coordenadas[0] for cidade in cidades]
+            ys = [cidade.coordenadas[1] for cidade in cidades]
+        else:
+            xs, ys = coordenadas
+        if numpy is not None:
+            self.xs = numpy.asarray(xs, dtype=numpy.float64)
+            self.ys = numpy.asarray(ys, dtype=numpy.float64)
+        else:
+            self.xs, self.ys = list(xs), list(ys)
+
+        if cidades:
+            ids = [cidade.id for cidade in cidades]
+            base = min(ids)
+            if max(ids) - base < 2 * len(ids):
+                self.base = base
+                self.posicoes = [i - base for i in ids]
+                self.tamanho_tabela = max(ids) - base + 1
+                if numpy is not None:
+                    self.posicoes = numpy.asarray(self.posicoes, dtype=numpy.intp)
+
+    @classmethod
+    def de_grafo(cls, grafo, metrica: str = MANHATTAN, **argumentos):
+        """Usa as coordenadas de um GrafoCompacto, sem precisar criar as cidades"""
+        heuristica = cls([], metrica, coordenadas=(grafo.xs, grafo.ys), **argumentos)
+        # Num grafo carregado de arquivo, as cidades só existem quando alguém pede,
+        # e o grafo já sabe a linha de cada uma
+        heuristica.cidades = grafo.cidades
+        heuristica.indices = grafo.indices
+        return heuristica
+
+    def coordenadas(self, destino):
+        """Coordenadas do destino (uma cidade ou um par (x, y))"""
+        if isinstance(destino, Cidade):
+            return destino.coordenadas[0], destino.coordenadas[1]
+        return destino[0], destino[1]
+
+    def todas(self, destino):
+        """
+        Distância estimada de cada cidade até o destino, numa única chamada vetorizada.
+
+        :return: numpy.ndarray (ou lista) na ordem das cidades
+        """
+        x, y = self.coordenadas(destino)
+        if numpy is not None:
+            distancias = distancias_numpy(self.xs, self.ys, x, y, self.metrica, self.raio)
+            return distancias * self.fator if self.fator != 1 else distancias
+        distancias = distancias_python(self.xs, self.ys, x, y, self.metrica, self.raio)
+        return [d * self.fator for d in distancias] if self.fator != 1 else distancias
+
+    def estimar(self, cidades: list, destino):
+        """
+        Distância estimada de várias cidades (vizinhos, uma fronteira inteira) até o
+        destino, numa única chamada vetorizada.
+
+        :return: numpy.ndarray (ou lista) na ordem das cidades passadas
+        """
+        linhas = [self.indices[cidade] for cidade in cidades]
+        x, y = self.coordenadas(destino)
+        if numpy is not None:
+            linhas = numpy.asarray(linhas, dtype=numpy.intp)
+            distancias = distancias_numpy(self.xs[linhas], self.ys[linhas], x, y, self.metrica, self.raio)
+            return distancias * self.fator if self.fator != 1 else distancias
+        distancias = distancias_python([self.xs[i] for i in linhas], [self.ys[i] for i in linhas],
+                                       x, y, self.metrica, self.raio)
+        return [d * self.fator for d in distancias] if self.fator != 1 else distancias
+
+    def montar_tabela(self, destino):
+        """
+        Estimativas de todas as cidades até o destino num array('d'), na posição da
+        cidade (cidade.id - base, ou a linha se os ids não forem contíguos).
+        Copiar o vetor numpy para um array é uma cópia de memória só, sem criar um
+        float Python para cada cidade.
+        """
+        valores = self.todas(destino)
+        if self.base is None:
+            return array('d', valores.tobytes()) if numpy is not None else array('d', valores)
+        if numpy is not None:
+            tabela = numpy.full(self.tamanho_tabela, numpy.nan)
+            tabela[self.posicoes] = valores
+            return array('d', tabela.tobytes())
+        tabela = array('d', [math.nan]) * self.tamanho_tabela
+        for posicao, valor in zip(self.posicoes, valores):
+            tabela[posicao] = valor
+        return tabela
+
+    def tabela(self, destino):
+        """Tabela de estimativas até o destino (ver montar_tabela), guardada para os últimos destinos"""
+        tabela = self.tabelas.get(destino)
+        if tabela is None:
+            tabela = self.montar_tabela(destino)
+            self.tabelas[destino] = tabela
+            while len(self.tabelas) > self.tamanho_cache:
+                self.tabelas.popitem(last=False)
+        else:
+            self.tabelas.move_to_end(destino)
+        return tabela
+
+    def direta(self, cidade: Cidade, destino):
+        """Estimativa calculada só para a cidade, para cidades que não estão na tabela"""
+        x, y = self.coordenadas(destino)
+        distancia = distancias_python([cidade.coordenadas[0]], [cidade.coordenadas[1]], x, y,
+                                      self.metrica, self.raio)[0]
+        return float(distancia * self.fator)
+
+    def consultar(self, tabela, cidade: Cidade, destino):
+        """
+        Estimativa da cidade na tabela do destino. Uma cidade que não foi indexada (id fora
+        da faixa da tabela, ou num buraco dela, que fica com NaN) não pode pegar o valor de
+        outra posição, ou a estimativa deixa de ser admissível: ela é calculada direto.
+        """
+        if self.base is not None:
+            posicao = cidade.id - self.base
+            if 0 <= posicao < self.tamanho_tabela:
+                valor = tabela[posicao]
+                # NaN é diferente de si mesmo
+                if valor == valor:
+                    return valor
+            return self.direta(cidade, destino)
+        linha = self.indices.get(cidade)
+        return tabela[linha] if linha is not None else self.direta(cidade, destino)
+
+    def para_destino(self, destino):
+        """
+        Prepara a tabela do destino e retorna uma função estimar(cidade), que só consulta a tabela.
+        """
+        tabela = self.tabela(destino)
+        if self.base is not None:
+            base, tamanho = self.base, self.tamanho_tabela
+
+            def estimar(cidade):
+                posicao = cidade.id - base
+                if 0 <= posicao < tamanho:
+                    valor = tabela[posicao]
+                    if valor == valor:
+                        return valor
+                return self.direta(cidade, destino)
+            return estimar
+        return lambda cidade: self.consultar(tabela, cidade, destino)
+
+    def __call__(self, cidade: Cidade, destino):
+        """Mesma assinatura das outras heurísticas: heuristica(cidade, destino)"""
+        return self.consultar(self.tabela(destino), cidade, destino)
+
+    def __repr__(self):
+        return "HeuristicaVetorizada(%d cidades, %s)" % (len(self.xs), self.metrica)
+
+
+if __name__ == "__main__":
+    from buscas import astar, greedy_best_first
+    from geradores import geometrico
+    import random
+    import time
+
+    cidades = geometrico(20000)
+    vetorizada = HeuristicaVetorizada(cidades)
+    sorteio = random.Random(0)
+    pares = [sorteio.sample(cidades, 2) for _ in range(20)]
+
+    heuristicas = (
+        ("Cidade.estimativa", None),
+        ("manhattan vetorizada", vetorizada),
+        ("math.dist", lambda cidade, destino: math.dist(cidade.coordenadas, destino.coordenadas)),
+        ("euclidiana vetorizada", HeuristicaVetorizada(cidades, EUCLIDIANA)),
+    )
+    for busca in (astar, greedy_best_first):
+        for nome, heuristica in heuristicas:
+            inicio = time.perf_counter()
+            trilhas = [busca(a, b, heuristica=heuristica) for a, b in pares]
+            print("%-18s %-22s %8.2fms por consulta (custo total %.1f)" % (
+                busca.__name__, nome, (time.perf_counter() - inicio) * 1000 / len(pares),
+                sum(trilha.custo for trilha in trilhas if trilha is not None)))
+
+    destino = cidades[0]
+    print("Euclidiana dos vizinhos:", HeuristicaVetorizada(cidades, EUCLIDIANA).estimar(destino.vizinhos, destino))
+    print("Natal -> Mossoró (haversine):", HeuristicaVetorizada(
+        [Cidade('natal', (-5.79, -35.21)), Cidade('mossoro', (-5.19, -37.34))], HAVERSINE).todas((-5.79, -35.21)))
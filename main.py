@@ -1,11 +1,18 @@
 from buscas import *
+from espacial import IndiceEspacial
+import argparse
+import gzip
+import json
 import os
+import platform
+import random
 
 """
 Comandos do interpretador de arquivo
 """
 CIDADE = 'cidade'
 ESTRADA = 'estrada'
+MAO_UNICA = 'mao_unica'
 ESTIMATIVA = 'estimativa'
 
 
@@ -20,60 +27,103 @@ def is_numeric(s):
         return False
 
 
+def abrir(caminho):
+    """
+    Abre o arquivo para leitura de texto. Se ele estiver compactado com gzip
+    (reconhecemos pelos dois primeiros bytes), descompactamos enquanto lemos.
+    """
+    with open(caminho, 'rb') as f:
+        compactado = f.read(2) == b'\x1f\x8b'
+    if compactado:
+        return gzip.open(caminho, 'rt', encoding='utf-8')
+    return open(caminho, encoding='utf-8')
+
+
 class LeitorInput:
     """
     Serve para ler um arquivo que contém os nomes das cidades, as estradas
     e a estimativa de cada cidade até o destino. Essa classe vai ler o arquivo
     e gerar as cidades, as estradas e informar as estimativas para poder jogar
     nos algoritmos de busca.
+
+    O arquivo é lido linha a linha (não guardamos o texto em memória), e pode
+    estar compactado com gzip. As cidades ficam indexadas pelo nome, então
+    cada estrada ou estimativa é resolvida com uma consulta ao dicionário.
+
+    Uma cidade pode ter coordenadas: "cidade natal -5.79 -35.21".
+    Uma estrada de mão única (só da origem para o destino) usa o comando mao_unica:
+    "mao_unica natal parnamirim 20".
     """
-    input = None
     cidades = None
     estradas = None
     estimativas = None
+    # nome -> cidade
+    indice = None
+    # índice pelas coordenadas, montado na primeira consulta de mais_proxima
+    espacial = None
 
     def __init__(self, dados):
         self.cidades = list()
         self.estradas = list()
         self.estimativas = dict()
+        self.indice = dict()
 
         if not os.path.isfile(dados):
             print("cade o arquivo?")
             return
-        f = open(dados)
-        self.input = f.read()
-        f.close()
-        self.input = [x for x in self.input.split('\n') if x]
-
-        for linha in self.input:
-            comando, *tokens = linha.split(' ')
-            if comando == CIDADE:
-                self.cidades.append(Cidade(tokens[0]))
-
-            elif comando == ESTRADA:
-                origem = self.find(tokens[0])
-                destino = self.find(tokens[1])
-                custo = tokens[-1]
-                custo = 0 if not is_numeric(custo) else float(custo)
-
-                if all([origem, destino]):
-                    self.estradas.append(Estrada(origem, destino, custo))
-
-            elif comando == ESTIMATIVA:
-                cidade = self.find(tokens[0])
-                custo = tokens[-1]
-                custo = 0 if not is_numeric(custo) else float(custo)
-
-                if cidade:
-                    self.estimativas[cidade] = custo
-                    cidade.estimativa_fornecida = custo
+
+        with abrir(dados) as f:
+            for numero, linha in enumerate(f, 1):
+                if not linha.strip():
+                    continue
+                try:
+                    self.interpretar(linha)
+                except Exception as e:
+                    raise Exception("%s, linha %d: %s" % (dados, numero, e)) from e
+
+    def interpretar(self, linha: str):
+        """Interpreta uma linha do arquivo"""
+        comando, *tokens = linha.split()
+        if comando == CIDADE:
+            if len(tokens) >= 3 and is_numeric(tokens[1]) and is_numeric(tokens[2]):
+                cidade = Cidade(tokens[0], (float(tokens[1]), float(tokens[2])))
+            else:
+                cidade = Cidade(tokens[0])
+            self.cidades.append(cidade)
+            self.indice.setdefault(cidade.nome, cidade)
+            self.espacial = None
+
+        elif comando == ESTRADA or comando == MAO_UNICA:
+            if len(tokens) < 2:
+                raise Exception("Estrada precisa de origem e destino: %s" % linha.strip())
+            origem = self.find(tokens[0])
+            destino = self.find(tokens[1])
+            custo = tokens[-1]
+            custo = 0 if not is_numeric(custo) else float(custo)
+
+            self.estradas.append(Estrada(origem, destino, custo, mao_unica=comando == MAO_UNICA))
+
+        elif comando == ESTIMATIVA:
+            if not tokens:
+                raise Exception("Estimativa precisa de uma cidade: %s" % linha.strip())
+            cidade = self.find(tokens[0])
+            custo = tokens[-1]
+            custo = 0 if not is_numeric(custo) else float(custo)
+
+            self.estimativas[cidade] = custo
+            cidade.estimativa_fornecida = custo
 
     def find(self, nome: str):
-        for cidade in self.cidades:
-            if cidade.nome == nome:
-                return cidade
+        cidade = self.indice.get(nome)
+        if cidade is None:
+            raise Exception("Cidade não encontrada: %s" % nome)
+        return cidade
 
-        raise Exception("Cidade não encontrada: %s" % nome)
+    def mais_proxima(self, ponto):
+        """Cidade mais perto do ponto (x, y), para quando só temos uma posição, e não um nome"""
+        if self.espacial is None:
+            self.espacial = IndiceEspacial(self.cidades)
+        return self.espacial.mais_proxima(ponto)
 
     @property
     def destino(self):
@@ -84,27 +134,133 @@ class LeitorInput:
         raise Exception("Configure a cidade destino com estimativa 0!")
 
 
+def medir_consultas(leitor: LeitorInput, algoritmos: list, consultas: int, semente: int = 0,
+                    memoria: bool = False, amostrador: Amostrador = None):
+    """
+    Roda cada algoritmo (nomes de benchmark.ALGORITMOS) nos mesmos pares sorteados
+    entre as cidades do mapa, com uma Metricas por consulta, e junta tudo com resumir.
+
+    Como em benchmark.medir, a memória é medida numa segunda passada (o tracemalloc
+    deixa as buscas bem mais lentas e estragaria os tempos). O amostrador, se
+    informado, fica ligado durante a primeira passada de todos os algoritmos.
+
+    :return: dicionário pronto para virar JSON
+    """
+    from benchmark import ALGORITMOS, TAMANHO_MAXIMO
+
+    cidades = leitor.cidades
+    sorteio = random.Random(semente)
+    pares = [sorteio.sample(cidades, 2) for _ in range(consultas)] if len(cidades) >= 2 else []
+
+    resultados = list()
+    for nome in algoritmos:
+        if len(cidades) > TAMANHO_MAXIMO.get(nome, inf):
+            continue
+        algoritmo = ALGORITMOS[nome]
+        medicoes = list()
+        trilhas = list()
+        if amostrador is not None:
+            amostrador.iniciar()
+        for origem, destino in pares:
+            with Metricas() as metricas:
+                trilhas.append(algoritmo(origem, destino, cidades, metricas))
+            medicoes.append(metricas)
+        if amostrador is not None:
+            amostrador.parar()
+
+        resultado = {'algoritmo': nome}
+        resultado.update(resumir(medicoes))
+        # dijkstra devolve uma trilha de custo infinito quando não há caminho
+        encontradas = [trilha for trilha in trilhas if trilha is not None and trilha.custo < inf]
+        resultado['encontrados'] = len(encontradas)
+        resultado['custo_total'] = sum(trilha.custo for trilha in encontradas)
+
+        if memoria:
+            picos = list()
+            for origem, destino in pares:
+                with Metricas(memoria=True) as metricas:
+                    algoritmo(origem, destino, cidades, SILENCIOSO)
+                picos.append(metricas.pico_memoria)
+            resultado['pico_memoria'] = max(picos, default=0)
+        resultados.append(resultado)
+
+    return {
+        'cidades': len(cidades),
+        'estradas': len(leitor.estradas),
+        'consultas': len(pares),
+        'semente': semente,
+        'python': platform.python_version(),
+        'algoritmos': resultados,
+    }
+
+
 if __name__ == "__main__":
-    arquivo = "grafo.txt"
+    """
+    Exemplos:
+    python main.py
+    python main.py grafo.txt --metricas metricas.json --consultas 1000
+    python main.py grafo.txt --metricas - --algoritmos astar dijkstra --memoria --perfil perfil.txt
+    """
+    parser = argparse.ArgumentParser(description="Roda as buscas no mapa do arquivo.")
+    parser.add_argument('arquivo', nargs='?', default="grafo.txt")
+    parser.add_argument('--metricas', metavar='SAIDA',
+                        help="em vez das buscas de exemplo, roda várias consultas sorteadas e grava as "
+                             "métricas de cada algoritmo em JSON ('-' para a saída padrão)")
+    parser.add_argument('--consultas', type=int, default=100)
+    parser.add_argument('--algoritmos', nargs='+', default=None,
+                        help="nomes de benchmark.ALGORITMOS (por padrão, todos)")
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--memoria', action='store_true', help="mede também o pico de memória de cada consulta")
+    parser.add_argument('--perfil', metavar='ARQUIVO',
+                        help="liga o profiler por amostragem e grava as pilhas no formato colapsado (flamegraph)")
+    parser.add_argument('--intervalo', type=float, default=1, help="intervalo (ms) entre as amostras do profiler")
+    argumentos = parser.parse_args()
+
+    leitor = LeitorInput(argumentos.arquivo)
+
+    if argumentos.metricas:
+        from benchmark import ALGORITMOS
+
+        algoritmos = argumentos.algoritmos or list(ALGORITMOS)
+        for nome in algoritmos:
+            if nome not in ALGORITMOS:
+                parser.error("algoritmo desconhecido: %s (opções: %s)" % (nome, ", ".join(ALGORITMOS)))
+        amostrador = Amostrador(argumentos.intervalo / 1000) if argumentos.perfil else None
+
+        relatorio = medir_consultas(leitor, algoritmos, argumentos.consultas, argumentos.semente,
+                                    argumentos.memoria, amostrador)
+        relatorio['arquivo'] = argumentos.arquivo
+        if amostrador is not None:
+            amostrador.salvar(argumentos.perfil)
+            relatorio['perfil'] = {
+                'arquivo': argumentos.perfil,
+                'amostras': amostrador.amostras,
+                'funcoes': amostrador.resumo(),
+            }
 
-    leitor = LeitorInput(arquivo)
+        if argumentos.metricas == '-':
+            print(json.dumps(relatorio, indent=2))
+        else:
+            with open(argumentos.metricas, 'w') as f:
+                json.dump(relatorio, f, indent=2)
+        raise SystemExit
 
     inicio = leitor.find('arad')
 
     print("---\n--- BREADTH-FIRST SEARCH\n---")
-    retorno = breadth_first(inicio, leitor.destino)
+    retorno = breadth_first(inicio, leitor.destino, rastreador=Impressora())
     print("%s (custo %.0f)" % (retorno, retorno.custo))
 
     print("---\n--- ITERATIVE DEEPENING SEARCH\n---")
-    retorno = iterative_deepening(inicio, leitor.destino)
+    retorno = iterative_deepening(inicio, leitor.destino, rastreador=Impressora())
     print("%s (custo %.0f)" % (retorno, retorno.custo))
 
     print("---\n--- GREEDY BEST FIRST SEARCH\n---")
-    retorno = greedy_best_first(inicio, leitor.destino)
+    retorno = greedy_best_first(inicio, leitor.destino, rastreador=Impressora())
     print("%s (custo %.0f)" % (retorno, retorno.custo))
 
     print("---\n--- A-STAR (A*)\n---")
-    retorno = astar(inicio, leitor.destino)
+    retorno = astar(inicio, leitor.destino, rastreador=Impressora())
     print("%s (custo %.0f)" % (retorno, retorno.custo))
 
     print("---\n--- DIJKSTRA\n---")
@@ -0,0 +1,188 @@
+from buscas import *
+from grafo_compacto import GrafoCompacto
+from array import array
+import pickle
+
+
+class Marcos:
+    """
+    Heurística ALT (A*, landmarks e desigualdade triangular). Escolhemos k cidades
+    como marcos e guardamos a distância de cada marco até todas as cidades.
+
+    Para qualquer marco L, pela desigualdade triangular:
+    d(v, t) >= d(L, t) - d(L, v)
+    d(v, t) >= d(v, L) - d(t, L)
+    Então o maior desses valores entre todos os marcos é uma estimativa que nunca
+    passa do custo real, para qualquer par de cidades, e não só para o destino
+    configurado no arquivo (como acontece com as estimativas fornecidas).
+
+    Sem estradas de mão única, d(v, L) = d(L, v) e as duas desigualdades viram
+    |d(L, t) - d(L, v)|. Com elas, guardamos também a distância de todas as cidades
+    até cada marco (um Dijkstra de trás pra frente por marco).
+
+    Uso: astar(origem, destino, grafo, heuristica=marcos.estimativa)
+    """
+    # grafo em que as distâncias foram calculadas
+    grafo = None
+    # índices das cidades escolhidas como marcos
+    indices = None
+    # distancias[i][v] é a distância do marco i até a cidade de índice v
+    distancias = None
+    # reversas[i][v] é a distância da cidade de índice v até o marco i
+    # (a mesma lista de distancias se o grafo não tem estradas de mão única)
+    reversas = None
+    # para as últimas cidades usadas como ponta fixa (destino em estimativa, origem
+    # em estimativa_reversa): cidade -> (distâncias dos marcos até ela, dela até os marcos)
+    pontas = None
+
+    def __init__(self, grafo: GrafoCompacto, k: int = 8, inicial: int = 0):
+        """
+        Escolhe os marcos pelo critério do mais distante: o primeiro é a cidade mais
+        longe de inicial, e cada próximo é a cidade mais longe de todos os já escolhidos.
+        Cidades sem caminho até os marcos (outro componente) são escolhidas primeiro.
+        """
+        self.grafo = grafo
+        self.indices = list()
+        self.distancias = list()
+        self.reversas = self.distancias if not grafo.dirigido else list()
+        self.pontas = dict()
+
+        k = min(k, len(grafo))
+        if not k:
+            return
+
+        mais_perto = grafo.distancias(inicial)
+        while len(self.indices) < k:
+            marco = max(range(len(grafo)), key=lambda v: mais_perto[v])
+            if marco in self.indices:
+                break
+            distancias = grafo.distancias(marco)
+            self.indices.append(marco)
+            self.distancias.append(distancias)
+            if grafo.dirigido:
+                self.reversas.append(grafo.distancias(marco, reverso=True))
+            for v in range(len(grafo)):
+                if distancias[v] < mais_perto[v] or len(self.indices) == 1:
+                    mais_perto[v] = distancias[v]
+
+    def ponta(self, cidade: Cidade):
+        """Distâncias dos marcos até a cidade e da cidade até os marcos, guardadas para as últimas cidades"""
+        ponta = self.pontas.get(cidade)
+        if ponta is None:
+            if len(self.pontas) >= 2:
+                self.pontas.clear()
+            t = self.grafo.indice(cidade)
+            ponta = self.pontas[cidade] = ([distancias[t] for distancias in self.distancias],
+                                           [reversas[t] for reversas in self.reversas])
+        return ponta
+
+    def limite(self, de_marcos, de_ate_marcos, para_marcos, para_ate_marcos):
+        """
+        Limite inferior para o custo de uma cidade (de) até outra (para), a partir das
+        distâncias dos marcos até cada uma e de cada uma até os marcos.
+        Retorna inf se os marcos mostram que não existe caminho: um marco chega em de
+        mas não em para, ou para chega num marco e de não.
+        """
+        melhor = 0
+        for ate_de, de_ate, ate_para, para_ate in zip(de_marcos, de_ate_marcos, para_marcos, para_ate_marcos):
+            # d(de, para) >= d(L, para) - d(L, de)
+            if ate_para == inf:
+                if ate_de != inf:
+                    return inf
+            elif ate_de != inf and ate_para - ate_de > melhor:
+                melhor = ate_para - ate_de
+            # d(de, para) >= d(de, L) - d(para, L)
+            if de_ate == inf:
+                if para_ate != inf:
+                    return inf
+            elif para_ate != inf and de_ate - para_ate > melhor:
+                melhor = de_ate - para_ate
+        return melhor
+
+    def estimativa(self, cidade: Cidade, destino: Cidade):
+        """
+        Limite inferior para o custo de cidade até destino. Retorna inf se os marcos
+        mostram que não existe caminho entre elas.
+        """
+        marcos_destino, destino_marcos = self.ponta(destino)
+        v = self.grafo.indice(cidade)
+        if self.reversas is not self.distancias:
+            return self.limite([distancias[v] for distancias in self.distancias],
+                               [reversas[v] for reversas in self.reversas], marcos_destino, destino_marcos)
+
+        # Sem mão única, as duas desigualdades de limite viram |d(L, t) - d(L, v)|
+        melhor = 0
+        for ate_destino, distancias in zip(marcos_destino, self.distancias):
+            ate_cidade = distancias[v]
+            if ate_cidade == inf or ate_destino == inf:
+                if ate_cidade != ate_destino:
+                    return inf
+                continue
+            diferenca = abs(ate_destino - ate_cidade)
+            if diferenca > melhor:
+                melhor = diferenca
+        return melhor
+
+    def estimativa_reversa(self, cidade: Cidade, origem: Cidade):
+        """
+        Limite inferior para o custo de origem até cidade (o sentido contrário de
+        estimativa), para a busca de trás pra frente do bidirectional_astar.
+        """
+        v = self.grafo.indice(cidade)
+        return self.limite(*self.ponta(origem), [distancias[v] for distancias in self.distancias],
+                           [reversas[v] for reversas in self.reversas])
+
+    def salvar(self, caminho: str):
+        """Grava os marcos e as distâncias, para não precisar recalcular"""
+        with open(caminho, 'wb') as f:
+            pickle.dump({'indices': self.indices, 'distancias': self.distancias,
+                         'reversas': self.reversas if self.grafo.dirigido else None}, f)
+
+    @classmethod
+    def carregar(cls, caminho: str, grafo: GrafoCompacto):
+        """Carrega marcos gravados com salvar. O grafo precisa ser o mesmo em que foram calculados."""
+        with open(caminho, 'rb') as f:
+            dados = pickle.load(f)
+
+        if any(len(distancias) != len(grafo) for distancias in dados['distancias']):
+            raise Exception("Os marcos não correspondem a este grafo")
+        # Arquivos antigos não têm as distâncias reversas, e só servem sem mão única
+        reversas = dados.get('reversas')
+        if (reversas is not None) != grafo.dirigido:
+            raise Exception("Os marcos não correspondem a este grafo")
+
+        marcos = cls.__new__(cls)
+        marcos.grafo = grafo
+        marcos.indices = dados['indices']
+        marcos.distancias = [array('d', distancias) for distancias in dados['distancias']]
+        marcos.reversas = marcos.distancias if reversas is None else [array('d', r) for r in reversas]
+        marcos.pontas = dict()
+        return marcos
+
+    def __repr__(self):
+        return "Marcos(%s)" % ", ".join(self.grafo.nome(i) for i in self.indices)
+
+
+if __name__ == "__main__":
+    """
+    Compara a quantidade de cidades expandidas pelo A* com distância manhattan
+    e com a heurística dos marcos, numa grade com pares aleatórios.
+    """
+    from geradores import grade
+    import random
+
+    cidades = grade(40, 40)
+    grafo = GrafoCompacto(cidades)
+    marcos = Marcos(grafo, 8)
+    print(marcos)
+
+    sorteio = random.Random(0)
+    expandidos = {"manhattan": 0, "marcos": 0}
+    for _ in range(50):
+        origem, destino = sorteio.sample(cidades, 2)
+        for nome, heuristica in (("manhattan", Cidade.distancia_estimada), ("marcos", marcos.estimativa)):
+            contador = Contador()
+            astar(origem, destino, grafo, heuristica, rastreador=contador)
+            expandidos[nome] += contador.expandidos
+
+    print("Cidades expandidas em 50 consultas:", expandidos)
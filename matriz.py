@@ -0,0 +1,298 @@
+from grafo_compacto import GrafoCompacto, MARCA, alinhar
+from array import array
+import math
+import mmap
+import multiprocessing
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+"""
+Estado compartilhado com os processos de trabalho. É preenchido antes de criar os
+processos, e como eles são criados por fork, herdam o grafo sem copiar nem serializar
+nada: as páginas só seriam copiadas se alguém escrevesse nelas, e ninguém escreve.
+Se o grafo foi carregado de um arquivo binário (GrafoCompacto.carregar), os
+processos leem as mesmas páginas mapeadas.
+"""
+GRAFO = None
+DESTINOS = None
+COM_ANTERIORES = False
+
+"""
+Formato binário da matriz gravada por all_pairs: um cabeçalho (assinatura, versão,
+marca de ordem dos bytes, linhas, colunas e o tipo das células, 'd' para float64 ou
+'f' para float32) e depois as linhas, uma atrás da outra.
+"""
+ASSINATURA_MATRIZ = b'MATRIZCM'
+VERSAO_MATRIZ = 1
+CABECALHO_MATRIZ = struct.Struct('=8sIIqq8s')
+
+"""
+Custos aproximados, em nanossegundos, usados para escolher o método de all_pairs:
+cada arco relaxado pelo Dijkstra (Python puro, por processo) e cada célula
+atualizada pelo Floyd-Warshall (numpy). Acima de LIMITE_FLOYD cidades, a matriz
+n x n do Floyd-Warshall não cabe confortavelmente em memória, e ele nunca é usado.
+"""
+CUSTO_ARCO_DIJKSTRA = 60
+CUSTO_CELULA_FLOYD = 3
+LIMITE_FLOYD = 5000
+
+
+def calcular_linha(origem: int):
+    """
+    Calcula uma linha da matriz: as distâncias da origem até cada destino, parando
+    a busca quando todos os destinos forem acomodados.
+
+    :return: (distancias, anteriores), onde anteriores é None se não foi pedido
+    """
+    distancias, anteriores = GRAFO.arvore(origem, DESTINOS)
+    if DESTINOS is None:
+        return distancias, anteriores if COM_ANTERIORES else None
+    linha = [distancias[destino] for destino in DESTINOS]
+    return linha, anteriores if COM_ANTERIORES else None
+
+
+def distance_matrix(grafo: GrafoCompacto, origens: list, destinos: list, workers: int = 1, anteriores: bool = False):
+    """
+    Monta a matriz de custos origem x destino. Cada origem é uma busca um para muitos
+    no grafo, e as origens são divididas entre workers processos.
+
+    origens e destinos podem ser cidades ou índices do grafo. Se numpy estiver
+    instalado, a matriz é um numpy.ndarray (len(origens) x len(destinos)); se não,
+    é uma lista de listas. Células sem caminho valem inf.
+
+    Se anteriores for True, também retornamos, para cada origem, o array com a cidade
+    anterior de cada cidade no caminho (veja caminho_indices).
+
+    :return: matriz, ou (matriz, anteriores)
+    """
+    global GRAFO, DESTINOS, COM_ANTERIORES
+
+    origens = [o if isinstance(o, int) else grafo.indice(o) for o in origens]
+    destinos = [d if isinstance(d, int) else grafo.indice(d) for d in destinos]
+    GRAFO = grafo
+    DESTINOS = destinos
+    COM_ANTERIORES = anteriores
+
+    try:
+        if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            contexto = multiprocessing.get_context('fork')
+            with contexto.Pool(workers) as pool:
+                pedaco = max(1, len(origens) // (workers * 4))
+                resultados = pool.map(calcular_linha, origens, pedaco)
+        else:
+            # Sem fork não há como compartilhar o grafo de graça: calculamos aqui mesmo
+            resultados = [calcular_linha(origem) for origem in origens]
+    finally:
+        GRAFO = None
+        DESTINOS = None
+        COM_ANTERIORES = False
+
+    matriz = [linha for linha, _ in resultados]
+    if numpy is not None:
+        matriz = numpy.array(matriz, dtype=float).reshape(len(origens), len(destinos))
+
+    if anteriores:
+        return matriz, [arvore for _, arvore in resultados]
+    return matriz
+
+
+def caminho_indices(anteriores, destino: int):
+    """
+    Reconstrói o caminho até destino a partir do array de anteriores de uma origem.
+    Só faz sentido se o custo até o destino na matriz não for inf.
+
+    :return: lista de índices da origem até o destino
+    """
+    caminho = [destino]
+    while anteriores[caminho[-1]] != -1:
+        caminho.append(anteriores[caminho[-1]])
+    caminho.reverse()
+    return caminho
+
+
+def floyd_warshall(grafo: GrafoCompacto, bloco: int = 256):
+    """
+    Custos entre todos os pares pelo Floyd-Warshall vetorizado com numpy. Vale a pena
+    em grafos pequenos e densos, onde n³ operações de numpy custam menos do que n
+    Dijkstras em Python.
+
+    Para cada cidade intermediária k, cada linha i vira min(D[i], D[i, k] + D[k]).
+    As linhas são atualizadas em blocos, então a memória temporária é bloco x n,
+    e não n x n.
+
+    :return: numpy.ndarray n x n (inf onde não há caminho)
+    """
+    if numpy is None:
+        raise Exception("floyd_warshall precisa do numpy")
+    n = len(grafo)
+    custos = numpy.full((n, n), numpy.inf)
+    offsets = numpy.frombuffer(grafo.offsets, dtype=numpy.int64)
+    linhas = numpy.repeat(numpy.arange(n), numpy.diff(offsets))
+    # Estradas paralelas: fica a mais curta
+    numpy.minimum.at(custos, (linhas, numpy.frombuffer(grafo.alvos, dtype=numpy.int32)),
+                     numpy.frombuffer(grafo.pesos, dtype=numpy.float64))
+    numpy.fill_diagonal(custos, 0)
+
+    temporario = numpy.empty((min(bloco, n), n))
+    for k in range(n):
+        via_k = custos[k]
+        for inicio in range(0, n, bloco):
+            fatia = custos[inicio:inicio + bloco]
+            soma = temporario[:len(fatia)]
+            numpy.add(fatia[:, k, None], via_k, out=soma)
+            numpy.minimum(fatia, soma, out=fatia)
+    return custos
+
+
+def escolher_metodo(grafo: GrafoCompacto, origens: int, workers: int):
+    """
+    Escolhe entre 'dijkstra' (um Dijkstra por origem, divididos entre os processos)
+    e 'floyd_warshall' (sempre calcula todos os pares), pelo custo estimado de cada um.
+    """
+    n = len(grafo)
+    if numpy is None or n > LIMITE_FLOYD:
+        return 'dijkstra'
+    dijkstra = origens * (grafo.arcos + n) * math.log2(n + 1) * CUSTO_ARCO_DIJKSTRA / max(workers, 1)
+    floyd = n ** 3 * CUSTO_CELULA_FLOYD
+    return 'floyd_warshall' if floyd < dijkstra else 'dijkstra'
+
+
+def abrir_matriz(caminho: str):
+    """
+    Abre uma matriz gravada por all_pairs sem carregá-la: as células são lidas do
+    arquivo mapeado em memória conforme são acessadas.
+
+    :return: numpy.ndarray (linhas x colunas) sobre o mapeamento, ou, sem numpy,
+             um memoryview com o mesmo formato (matriz[i, j])
+    """
+    with open(caminho, 'rb') as f:
+        mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    assinatura, versao, marca, linhas, colunas, tipo = CABECALHO_MATRIZ.unpack_from(mapa)
+    if assinatura != ASSINATURA_MATRIZ or versao != VERSAO_MATRIZ:
+        raise Exception("Arquivo de matriz inválido: %s" % caminho)
+    if marca != MARCA:
+        raise Exception("Arquivo de matriz gravado com outra ordem de bytes: %s" % caminho)
+
+    tipo = tipo.rstrip(b'\0').decode()
+    inicio = alinhar(CABECALHO_MATRIZ.size)
+    if numpy is not None:
+        return numpy.ndarray((linhas, colunas), dtype=numpy.dtype(tipo), buffer=mapa, offset=inicio)
+    tamanho = linhas * colunas * struct.calcsize(tipo)
+    return memoryview(mapa)[inicio:inicio + tamanho].cast(tipo, [linhas, colunas])
+
+
+def all_pairs(grafo: GrafoCompacto, caminho: str = None, origens: list = None, destinos: list = None,
+              workers: int = 1, metodo: str = None, tipo: str = 'd'):
+    """
+    Custos de cada origem até cada destino (por padrão, todas as cidades, nos dois casos).
+
+    O método é 'dijkstra' (uma busca por origem, divididas entre workers processos,
+    como em distance_matrix) ou 'floyd_warshall' (numpy, para grafos pequenos e
+    densos). Se não for informado, escolher_metodo decide.
+
+    Se caminho for informado, as linhas são gravadas no arquivo conforme ficam prontas,
+    na ordem das origens, e a matriz inteira nunca precisa caber em memória (com o
+    Dijkstra). O retorno, nesse caso, é a matriz aberta do arquivo (abrir_matriz).
+    tipo 'f' grava as células em float32, com metade do tamanho.
+
+    :return: matriz (numpy.ndarray, lista de listas ou a matriz aberta do arquivo)
+    """
+    origens = list(range(len(grafo))) if origens is None else [
+        o if isinstance(o, int) else grafo.indice(o) for o in origens]
+    todos_destinos = destinos is None
+    destinos = list(range(len(grafo))) if destinos is None else [
+        d if isinstance(d, int) else grafo.indice(d) for d in destinos]
+    if metodo is None:
+        metodo = escolher_metodo(grafo, len(origens), workers)
+
+    def linhas_floyd():
+        custos = floyd_warshall(grafo)
+        for origem in origens:
+            yield custos[origem] if todos_destinos else custos[origem, destinos]
+
+    def linhas_dijkstra():
+        global GRAFO, DESTINOS, COM_ANTERIORES
+        GRAFO = grafo
+        DESTINOS = None if todos_destinos else destinos
+        COM_ANTERIORES = False
+        try:
+            if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+                contexto = multiprocessing.get_context('fork')
+                with contexto.Pool(workers) as pool:
+                    pedaco = max(1, min(64, len(origens) // (workers * 4)))
+                    for linha, _ in pool.imap(calcular_linha, origens, pedaco):
+                        yield linha
+            else:
+                for origem in origens:
+                    yield calcular_linha(origem)[0]
+        finally:
+            GRAFO = None
+            DESTINOS = None
+            COM_ANTERIORES = False
+
+    linhas = linhas_floyd() if metodo == 'floyd_warshall' else linhas_dijkstra()
+
+    if caminho is None:
+        matriz = [list(linha) for linha in linhas]
+        if numpy is not None:
+            matriz = numpy.array(matriz, dtype=tipo).reshape(len(origens), len(destinos))
+        return matriz
+
+    with open(caminho, 'wb') as f:
+        cabecalho = CABECALHO_MATRIZ.pack(ASSINATURA_MATRIZ, VERSAO_MATRIZ, MARCA, len(origens), len(destinos),
+                                          tipo.encode())
+        f.write(cabecalho)
+        f.write(bytes(alinhar(len(cabecalho)) - len(cabecalho)))
+        for linha in linhas:
+            if numpy is not None and isinstance(linha, numpy.ndarray):
+                f.write(linha.astype(tipo, copy=False).tobytes())
+            else:
+                f.write(array(tipo, linha).tobytes())
+    return abrir_matriz(caminho)
+
+
+if __name__ == "__main__":
+    """
+    Matriz 100 x 100 numa grade de 80 x 80, com quantidades diferentes de processos
+    """
+    from geradores import grade
+    import random
+    import time
+
+    cidades = grade(80, 80)
+    grafo = GrafoCompacto(cidades)
+    sorteio = random.Random(0)
+    origens = sorteio.sample(cidades, 100)
+    destinos = sorteio.sample(cidades, 100)
+
+    for workers in sorted({1, 2, multiprocessing.cpu_count()}):
+        inicio = time.perf_counter()
+        matriz = distance_matrix(grafo, origens, destinos, workers)
+        print("%d processo(s): %.2fs" % (workers, time.perf_counter() - inicio))
+
+    print("Custo de %s até %s: %.1f" % (origens[0], destinos[0], matriz[0][0]))
+
+    """
+    Todos os pares, com cada método, gravados em disco
+    """
+    import os
+    import tempfile
+
+    for largura in (10, 20, 30):
+        grafo = GrafoCompacto(grade(largura, largura))
+        arquivo = os.path.join(tempfile.gettempdir(), "matriz_%d.bin" % largura)
+        tempos = dict()
+        for metodo in ('dijkstra', 'floyd_warshall'):
+            inicio = time.perf_counter()
+            matriz = all_pairs(grafo, arquivo, metodo=metodo)
+            tempos[metodo] = time.perf_counter() - inicio
+        print("%5d cidades: dijkstra %.2fs, floyd_warshall %.2fs, escolhido: %s (%d bytes em disco)" % (
+            len(grafo), tempos['dijkstra'], tempos['floyd_warshall'],
+            escolher_metodo(grafo, len(grafo), 1), os.path.getsize(arquivo)))
+        del matriz
+        os.remove(arquivo)
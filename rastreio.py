@@ -0,0 +1,336 @@
+from time import perf_counter
+import os
+import sys
+import threading
+import tracemalloc
+
+
+class Rastreador:
+    """
+    Recebe os eventos das buscas. Essa classe base não faz nada, e é o que as buscas
+    usam quando ninguém passa um rastreador: assim elas rodam em silêncio.
+    Para acompanhar uma busca, estenda a classe e sobrescreva os eventos que interessam.
+    """
+
+    def inicio(self):
+        """A busca começou"""
+
+    def fim(self):
+        """A busca terminou"""
+
+    def visita(self, cidade):
+        """A cidade foi expandida (seus vizinhos vão ser examinados)"""
+
+    def empilha(self, cidade, fronteira: int):
+        """A cidade entrou na fronteira, que ficou com o tamanho informado"""
+
+    def desempilha(self, cidade):
+        """A cidade saiu da fronteira (mesmo que já tenha sido expandida e vá ser descartada)"""
+
+    def relaxa(self, cidade, vizinho, custo):
+        """Achamos um caminho melhor até o vizinho passando pela cidade, com o custo informado"""
+
+    def profundidade(self, limite: int):
+        """Busca em profundidade iterativa: começou uma rodada com esse limite
+        (de profundidade, ou de f = g + h no IDA*)"""
+
+
+"""
+Rastreador que não faz nada, compartilhado por todas as buscas
+"""
+SILENCIOSO = Rastreador()
+
+
+class Impressora(Rastreador):
+    """Imprime as cidades visitadas, do jeito que as buscas faziam antes"""
+
+    def visita(self, cidade):
+        print("visitando ", cidade)
+
+    def profundidade(self, limite: int):
+        print("Tentando com profundidade máxima de ", limite)
+
+
+class Contador(Rastreador):
+    """
+    Só conta: cidades expandidas, relaxamentos, entradas e saídas da fronteira, o
+    maior tamanho que a fronteira atingiu e o tempo gasto. Se for usado em várias
+    buscas, os valores se acumulam.
+    """
+    expandidos = None
+    relaxados = None
+    empilhados = None
+    desempilhados = None
+    maior_fronteira = None
+    tempo = None
+    comeco = None
+    # buscas em andamento: uma busca pode chamar outra (iterative_deepening chama
+    # depth_limited), e o tempo só é contado uma vez
+    abertas = None
+
+    def __init__(self):
+        self.expandidos = 0
+        self.relaxados = 0
+        self.empilhados = 0
+        self.desempilhados = 0
+        self.maior_fronteira = 0
+        self.tempo = 0
+        self.abertas = 0
+
+    def inicio(self):
+        if not self.abertas:
+            self.comeco = perf_counter()
+        self.abertas += 1
+
+    def fim(self):
+        self.abertas -= 1
+        if not self.abertas:
+            self.tempo += perf_counter() - self.comeco
+
+    def visita(self, cidade):
+        self.expandidos += 1
+
+    def empilha(self, cidade, fronteira: int):
+        self.empilhados += 1
+        if fronteira > self.maior_fronteira:
+            self.maior_fronteira = fronteira
+
+    def desempilha(self, cidade):
+        self.desempilhados += 1
+
+    def relaxa(self, cidade, vizinho, custo):
+        self.relaxados += 1
+
+    def __repr__(self):
+        return "%d expandidos, %d relaxados, %d empilhados, %d desempilhados, fronteira máxima %d, %.6fs" % (
+            self.expandidos, self.relaxados, self.empilhados, self.desempilhados, self.maior_fronteira, self.tempo)
+
+
+class Amostrador:
+    """
+    Profiler por amostragem: uma thread olha, a cada intervalo, em que função está a
+    thread que roda a busca, e conta quantas vezes viu cada pilha de chamadas.
+    Diferente do cProfile, não intercepta cada chamada, então a busca roda quase na
+    velocidade normal.
+
+    As pilhas saem no formato "colapsado" (uma linha por pilha, funções separadas por
+    ponto e vírgula, seguidas da contagem), que flamegraph.pl e speedscope leem direto.
+
+    O interpretador só troca de thread a cada sys.getswitchinterval() (5ms por
+    padrão), então intervalos menores do que isso não dão mais amostras.
+
+    Uso:
+    with Amostrador() as amostrador:
+        astar(origem, destino)
+    amostrador.salvar('perfil.txt')
+    """
+    intervalo = None
+    # pilha ("arquivo:funcao;arquivo:funcao;...") -> quantidade de amostras
+    pilhas = None
+    amostras = None
+    # thread observada
+    alvo = None
+    thread = None
+    parada = None
+
+    def __init__(self, intervalo: float = 0.001):
+        self.intervalo = intervalo
+        self.pilhas = dict()
+        self.amostras = 0
+
+    def iniciar(self, alvo: int = None):
+        """Começa a amostrar a thread alvo (por padrão, a que chamou). As amostras se acumulam entre iniciar e parar."""
+        if self.thread is not None:
+            return
+        self.alvo = alvo if alvo is not None else threading.get_ident()
+        self.parada = threading.Event()
+        self.thread = threading.Thread(target=self.amostrar, name="amostrador", daemon=True)
+        self.thread.start()
+
+    def parar(self):
+        if self.thread is None:
+            return
+        self.parada.set()
+        self.thread.join()
+        self.thread = None
+
+    def amostrar(self):
+        while not self.parada.wait(self.intervalo):
+            quadro = sys._current_frames().get(self.alvo)
+            # Se parar já foi chamado, a thread alvo só está esperando esta terminar
+            if quadro is None or self.parada.is_set():
+                continue
+            funcoes = list()
+            while quadro is not None:
+                codigo = quadro.f_code
+                funcoes.append("%s:%s" % (os.path.basename(codigo.co_filename),
+                                          getattr(codigo, 'co_qualname', codigo.co_name)))
+                quadro = quadro.f_back
+            pilha = ";".join(reversed(funcoes))
+            self.pilhas[pilha] = self.pilhas.get(pilha, 0) + 1
+            self.amostras += 1
+
+    def __enter__(self):
+        self.iniciar()
+        return self
+
+    def __exit__(self, *erro):
+        self.parar()
+
+    def colapsadas(self):
+        """Linhas no formato colapsado, da pilha mais vista para a menos vista"""
+        return ["%s %d" % (pilha, quantidade)
+                for pilha, quantidade in sorted(self.pilhas.items(), key=lambda item: -item[1])]
+
+    def salvar(self, caminho: str):
+        """Grava as pilhas no formato colapsado (flamegraph.pl perfil.txt > perfil.svg)"""
+        with open(caminho, 'w') as f:
+            for linha in self.colapsadas():
+                f.write(linha + "\n")
+
+    def resumo(self, quantidade: int = 10):
+        """
+        As funções onde a busca mais passou tempo (a última da pilha em cada amostra).
+
+        :return: lista de (função, fração das amostras)
+        """
+        proprias = dict()
+        for pilha, vezes in self.pilhas.items():
+            funcao = pilha.rsplit(";", 1)[-1]
+            proprias[funcao] = proprias.get(funcao, 0) + vezes
+        mais_vistas = sorted(proprias.items(), key=lambda item: -item[1])[:quantidade]
+        return [(funcao, vezes / self.amostras) for funcao, vezes in mais_vistas]
+
+    def __repr__(self):
+        return "Amostrador(%d amostras, %d pilhas)" % (self.amostras, len(self.pilhas))
+
+
+class Metricas(Contador):
+    """
+    Tudo o que dá para medir de uma busca: os contadores e o tempo do Contador, a
+    quantidade de buscas e, se pedido, o pico de memória alocada (com tracemalloc,
+    que deixa a busca várias vezes mais lenta, por isso fica desligado por padrão)
+    e as amostras de um Amostrador, ligado só enquanto a busca roda.
+
+    Para ter as métricas junto com o resultado, use medir_busca, ou use as métricas
+    como rastreador dentro de um with:
+    with Metricas() as metricas:
+        trilha = astar(origem, destino, rastreador=metricas)
+    """
+    buscas = None
+    memoria = None
+    # maior quantidade de bytes alocados durante uma busca (só com memoria=True)
+    pico_memoria = None
+    # memória já alocada quando a busca começou
+    memoria_inicial = None
+    # se fomos nós que ligamos o tracemalloc (e então desligamos no fim)
+    ligou_tracemalloc = None
+    amostrador = None
+
+    def __init__(self, memoria: bool = False, amostrador: Amostrador = None):
+        super().__init__()
+        self.buscas = 0
+        self.memoria = memoria
+        self.pico_memoria = 0
+        self.amostrador = amostrador
+
+    def inicio(self):
+        if not self.abertas:
+            self.buscas += 1
+            if self.memoria:
+                self.ligou_tracemalloc = not tracemalloc.is_tracing()
+                if self.ligou_tracemalloc:
+                    tracemalloc.start()
+                else:
+                    tracemalloc.reset_peak()
+                self.memoria_inicial = tracemalloc.get_traced_memory()[0]
+            if self.amostrador is not None:
+                self.amostrador.iniciar()
+        super().inicio()
+
+    def fim(self):
+        super().fim()
+        if not self.abertas:
+            if self.amostrador is not None:
+                self.amostrador.parar()
+            if self.memoria:
+                pico = tracemalloc.get_traced_memory()[1] - self.memoria_inicial
+                self.pico_memoria = max(self.pico_memoria, pico)
+                if self.ligou_tracemalloc:
+                    tracemalloc.stop()
+
+    def __enter__(self):
+        self.inicio()
+        return self
+
+    def __exit__(self, *erro):
+        self.fim()
+
+    def dicionario(self):
+        """As métricas num dicionário, pronto para virar JSON"""
+        dados = {
+            'buscas': self.buscas,
+            'tempo': self.tempo,
+            'expandidos': self.expandidos,
+            'relaxados': self.relaxados,
+            'empilhados': self.empilhados,
+            'desempilhados': self.desempilhados,
+            'maior_fronteira': self.maior_fronteira,
+        }
+        if self.memoria:
+            dados['pico_memoria'] = self.pico_memoria
+        return dados
+
+    def __repr__(self):
+        texto = super().__repr__()
+        if self.memoria:
+            texto += ", pico de memória %.1fKB" % (self.pico_memoria / 1024)
+        return texto
+
+
+def medir_busca(busca, *argumentos, memoria: bool = False, amostrador: Amostrador = None, **opcoes):
+    """
+    Roda busca(*argumentos, rastreador=metricas, **opcoes) e retorna o resultado junto
+    com as métricas. O tempo inclui tudo o que a busca faz, até as consultas que
+    terminam antes de começar a expandir (por exemplo, quando não há caminho).
+
+    :return: (resultado da busca, Metricas)
+    """
+    metricas = Metricas(memoria, amostrador)
+    with metricas:
+        resultado = busca(*argumentos, rastreador=metricas, **opcoes)
+    return resultado, metricas
+
+
+def percentil(valores: list, p: float):
+    """Percentil p (entre 0 e 100) de uma lista de valores"""
+    if not valores:
+        return 0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def resumir(medicoes: list):
+    """
+    Junta as métricas de várias consultas (uma Metricas por consulta): totais, médias
+    por consulta, percentis do tempo e os maiores valores de fronteira e memória.
+
+    :return: dicionário pronto para virar JSON
+    """
+    quantidade = len(medicoes)
+    tempos = [metricas.tempo for metricas in medicoes]
+    resumo = {
+        'consultas': quantidade,
+        'tempo_total': sum(tempos),
+        'tempo_medio': sum(tempos) / quantidade if quantidade else 0,
+        'p50_ms': percentil(tempos, 50) * 1000,
+        'p99_ms': percentil(tempos, 99) * 1000,
+        'maior_fronteira': max((metricas.maior_fronteira for metricas in medicoes), default=0),
+    }
+    for contador in ('expandidos', 'relaxados', 'empilhados', 'desempilhados'):
+        total = sum(getattr(metricas, contador) for metricas in medicoes)
+        resumo[contador] = total
+        resumo[contador + '_medio'] = total / quantidade if quantidade else 0
+    if any(metricas.memoria for metricas in medicoes):
+        resumo['pico_memoria'] = max(metricas.pico_memoria for metricas in medicoes)
+    return resumo
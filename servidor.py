@@ -0,0 +1,263 @@
+from main import LeitorInput
+from grafo_compacto import GrafoCompacto
+from matriz import caminho_indices
+from rastreio import percentil
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from math import inf
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+
+"""
+Grafo usado pelos processos de trabalho. É preenchido antes de criar os processos,
+que o herdam por fork sem copiar nada (como em matriz.py).
+"""
+GRAFO = None
+
+
+def resolver_lote(origem: int, destinos: list):
+    """
+    Roda nos processos de trabalho: uma única busca a partir da origem responde
+    todas as consultas do lote, e para quando todos os destinos forem acomodados.
+
+    :return: lista [(custo, caminho em índices ou None), ...] na ordem dos destinos
+    """
+    distancias, anteriores = GRAFO.arvore(origem, destinos)
+    return [(distancias[destino], caminho_indices(anteriores, destino) if distancias[destino] < inf else None)
+            for destino in destinos]
+
+
+class ServidorRotas:
+    """
+    Servidor asyncio de consultas de rota. O protocolo é de linhas JSON:
+    cada linha enviada é uma consulta, e cada linha recebida é a resposta.
+
+    Consulta: {"id": 1, "origem": "arad", "destino": "bucharest"}
+    Resposta: {"id": 1, "custo": 418.0, "caminho": ["arad", "sibiu", ...]}
+    Estatísticas: {"id": 2, "comando": "estatisticas"}
+
+    As buscas rodam num conjunto de processos, então o laço de eventos nunca fica
+    bloqueado. Consultas que chegam quase juntas com a mesma origem formam um lote,
+    resolvido com uma única busca um para muitos.
+    """
+    grafo = None
+    executor = None
+    workers = None
+    # quanto tempo (segundos) esperamos por mais consultas da mesma origem
+    janela = None
+    # quantidade de destinos que fecha o lote na hora
+    tamanho_lote = None
+    # origem -> lista de (destino, future) esperando
+    lotes = None
+    # origens com lote pronto, esperando um processo livre (em ordem de chegada)
+    prontas = None
+    # quantos lotes estão nos processos agora
+    ocupados = None
+    # métricas
+    latencias = None
+    respondidas = None
+    buscas = None
+    comeco = None
+
+    def __init__(self, grafo: GrafoCompacto, workers: int = None, janela: float = 0.002, tamanho_lote: int = 64):
+        global GRAFO
+        self.grafo = grafo
+        self.janela = janela
+        self.tamanho_lote = tamanho_lote
+        self.workers = workers or multiprocessing.cpu_count()
+        self.lotes = dict()
+        self.prontas = OrderedDict()
+        self.ocupados = 0
+        self.latencias = deque(maxlen=100000)
+        self.respondidas = 0
+        self.buscas = 0
+        self.comeco = time.perf_counter()
+
+        GRAFO = grafo
+        self.executor = ProcessPoolExecutor(self.workers,
+                                            mp_context=multiprocessing.get_context('fork'))
+
+    async def consultar(self, origem: int, destino: int):
+        """
+        Coloca a consulta no lote da origem e espera a resposta.
+
+        :return: (custo, caminho em índices ou None)
+        """
+        future = asyncio.get_running_loop().create_future()
+        lote = self.lotes.get(origem)
+        if lote is None:
+            lote = self.lotes[origem] = list()
+            asyncio.get_running_loop().call_later(self.janela, self.pronta, origem)
+        lote.append((destino, future))
+        if len(lote) >= self.tamanho_lote:
+            self.pronta(origem)
+        return await future
+
+    def pronta(self, origem: int):
+        """A janela da origem acabou (ou o lote encheu): o lote entra na fila para os processos"""
+        if origem in self.lotes:
+            self.prontas[origem] = None
+            self.despachar()
+
+    def despachar(self):
+        """
+        Manda os lotes prontos para os processos de trabalho, um por processo livre.
+        Enquanto todos estão ocupados, os lotes continuam recebendo consultas, então
+        quanto maior a carga, maiores os lotes.
+        """
+        while self.prontas and self.ocupados < self.workers:
+            origem, _ = self.prontas.popitem(last=False)
+            lote = self.lotes.pop(origem)
+            destinos = list({destino for destino, _ in lote})
+            self.ocupados += 1
+            self.buscas += 1
+            resultado = asyncio.get_running_loop().run_in_executor(self.executor, resolver_lote, origem, destinos)
+            resultado.add_done_callback(lambda r, lote=lote, destinos=destinos: self.entregar(lote, destinos, r))
+
+    def entregar(self, lote: list, destinos: list, resultado):
+        """Distribui o resultado da busca para cada consulta do lote"""
+        self.ocupados -= 1
+        self.despachar()
+        # exception() levantaria CancelledError, e as consultas do lote ficariam esperando para sempre
+        erro = Exception("Busca cancelada") if resultado.cancelled() else resultado.exception()
+        if erro is not None:
+            for _, future in lote:
+                if not future.done():
+                    future.set_exception(erro)
+            return
+        respostas = dict(zip(destinos, resultado.result()))
+        for destino, future in lote:
+            if not future.done():
+                future.set_result(respostas[destino])
+
+    def estatisticas(self):
+        """Latência (p50, p99), vazão e quantidade de buscas feitas"""
+        latencias = list(self.latencias)
+        decorrido = time.perf_counter() - self.comeco
+        return {
+            'respondidas': self.respondidas,
+            'buscas': self.buscas,
+            'consultas_por_busca': self.respondidas / self.buscas if self.buscas else 0,
+            'p50_ms': percentil(latencias, 50) * 1000,
+            'p99_ms': percentil(latencias, 99) * 1000,
+            'vazao': self.respondidas / decorrido if decorrido else 0,
+        }
+
+    async def responder(self, pedido: dict):
+        """Monta a resposta para uma linha recebida"""
+        if not isinstance(pedido, dict):
+            return {'erro': "Pedido precisa ser um objeto JSON"}
+        resposta = {'id': pedido.get('id')}
+        if pedido.get('comando') == 'estatisticas':
+            resposta.update(self.estatisticas())
+            return resposta
+
+        inicio = time.perf_counter()
+        for campo in ('origem', 'destino'):
+            if campo not in pedido:
+                resposta['erro'] = "Campo faltando: %s" % campo
+                return resposta
+            if not isinstance(pedido[campo], str):
+                resposta['erro'] = "Campo %s precisa ser o nome de uma cidade (texto)" % campo
+                return resposta
+        try:
+            origem = self.grafo.indice(pedido['origem'])
+            destino = self.grafo.indice(pedido['destino'])
+        except Exception as e:
+            resposta['erro'] = str(e)
+            return resposta
+
+        try:
+            custo, caminho = await self.consultar(origem, destino)
+        except Exception as e:
+            resposta['erro'] = str(e)
+            return resposta
+        if caminho is None:
+            resposta.update({'custo': None, 'caminho': None})
+        else:
+            resposta.update({'custo': custo, 'caminho': [self.grafo.nome(i) for i in caminho]})
+
+        self.latencias.append(time.perf_counter() - inicio)
+        self.respondidas += 1
+        return resposta
+
+    async def conexao(self, leitor: asyncio.StreamReader, escritor: asyncio.StreamWriter):
+        """Atende uma conexão: cada linha vira uma tarefa, e as respostas saem na ordem em que ficam prontas"""
+        pendentes = set()
+
+        async def atender(linha: bytes):
+            pedido = None
+            try:
+                pedido = json.loads(linha)
+                resposta = await self.responder(pedido)
+            except json.JSONDecodeError:
+                resposta = {'erro': "JSON inválido"}
+            except Exception as e:
+                # Um erro inesperado não pode deixar o cliente sem resposta
+                resposta = {'erro': "Erro interno: %s" % e}
+                if isinstance(pedido, dict):
+                    resposta['id'] = pedido.get('id')
+            escritor.write(json.dumps(resposta).encode() + b'\n')
+            await escritor.drain()
+
+        try:
+            while True:
+                linha = await leitor.readline()
+                if not linha:
+                    break
+                if not linha.strip():
+                    continue
+                tarefa = asyncio.ensure_future(atender(linha))
+                pendentes.add(tarefa)
+                tarefa.add_done_callback(pendentes.discard)
+            if pendentes:
+                await asyncio.gather(*pendentes)
+        finally:
+            escritor.close()
+
+    async def servir(self, host: str = '127.0.0.1', porta: int = 8765, unix: str = None):
+        """Abre o servidor (TCP, ou socket Unix se unix for informado) e atende para sempre"""
+        if unix:
+            servidor = await asyncio.start_unix_server(self.conexao, unix)
+        else:
+            servidor = await asyncio.start_server(self.conexao, host, porta)
+        async with servidor:
+            print("Servindo %s em %s" % (self.grafo, unix or "%s:%d" % (host, porta)))
+            await servidor.serve_forever()
+
+    def fechar(self):
+        self.executor.shutdown()
+
+
+if __name__ == "__main__":
+    """
+    Exemplos:
+    python servidor.py grafo.txt
+    python servidor.py grafo.bin --unix /tmp/rotas.sock --workers 4
+    """
+    parser = argparse.ArgumentParser(description="Servidor de consultas de rota (linhas JSON).")
+    parser.add_argument('arquivo', help="grafo no formato texto (grafo.txt) ou binário (GrafoCompacto.salvar)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--unix', help="caminho de um socket Unix, no lugar de TCP")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--janela', type=float, default=2, help="espera (ms) para juntar consultas da mesma origem")
+    argumentos = parser.parse_args()
+
+    with open(argumentos.arquivo, 'rb') as f:
+        binario = f.read(8) == b'GRAFOCSR'
+    if binario:
+        grafo = GrafoCompacto.carregar(argumentos.arquivo)
+    else:
+        grafo = GrafoCompacto.de_leitor(LeitorInput(argumentos.arquivo))
+
+    servidor = ServidorRotas(grafo, argumentos.workers, argumentos.janela / 1000)
+    try:
+        asyncio.run(servidor.servir(argumentos.host, argumentos.porta, argumentos.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.fechar()